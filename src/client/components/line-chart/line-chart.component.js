@@ -21,56 +21,33 @@ angular.module('lineChart').component('lineChart', {
             return labels;
         };
 
-        this.getStockValues = function (index, callback) {
+        this.getDashboard = function (index, callback) {
             // need at least 1 day
             if (this.labels.length == 0) return;
 
             // construct url
             var start = this.labels[this.labels.length - 1].format('YYYYMMDD');
             var end = this.labels[0].format('YYYYMMDD');
-            var url = 'http://localhost:8080/stocks/' + index + '/' + start + '/' + end;
+            var url = 'http://localhost:8080/dashboard/' + index + '/' + start + '/' + end;
 
+            // stock and sentiment values in one call, aligned by date
             $http({
                 method: 'GET',
                 url: url
             }).then(function successCallback(response) {
-                var values = [];
-                response.data.forEach(function (value) {
-                    values.push(value[1]);
-                });
-                callback(values);
-            });
-        };
-
-        this.getSentimentValues = function (index, callback) {
-            // need at least 1 day
-            if (this.labels.length == 0) return;
-
-            // construct url
-            var start = this.labels[this.labels.length - 1].format('YYYYMMDD');
-            var end = this.labels[0].format('YYYYMMDD');
-            var url = 'http://localhost:8080/sentiment/' + index + '/' + start + '/' + end;
-
-            $http({
-                method: 'GET',
-                url: url
-            }).then(function successCallback(response) {
-                var values = [];
-                response.data.forEach(function (value) {
-                    values.push(value[1]);
-                });
-                callback(values);
+                callback(response.data);
             });
         };
 
         $scope.$on('index', function($event, index) {
             self.index = index;
+            self.labels = self.getLabels();
             self.data = [[], []];
-            self.getStockValues(index, function (data) {
-                self.data[0] = data;
-            });
-            self.getSentimentValues(index, function(data) {
-                self.data[1] = data;
+            self.getDashboard(index, function (data) {
+                self.labels = data.dates.map(function (date) {
+                    return moment(String(date), 'YYYYMMDD');
+                });
+                self.data = [data.stocks, data.sentiments];
             });
         });
 
@@ -0,0 +1,197 @@
+"""
+Feature extraction for the model selection, with a cache on disk.
+
+Each corpus is tokenized once (same token pattern as sklearn) and its token
+stream is cached. The matrices of the vectorizers of the grid are derived
+from that stream instead of re-tokenizing the tweets:
+
+    - lowercasing maps the token ids to the ids of the lowercased terms
+    - stop words are removed by filtering token ids
+    - bigrams are built from the (filtered) unigram stream
+    - TF-IDF is a reweighting of the count matrix
+
+A hashing vectorizer (pipeline of a HashingVectorizer and a
+TfidfTransformer) is the count matrix with its columns hashed.
+
+The matrices are cached too, so re-running the grid after a change of the
+models only loads them. The cache is keyed on the content of the corpus, so
+it is only reused if the corpus is drawn the same way on every run: the
+samples and shuffles of load_datasets are seeded for that.
+
+The columns are in the order of sklearn (sorted terms), and the matrices
+are the ones CountVectorizer / TfidfVectorizer give, except for the rare
+characters whose lowercase form is not a single word character.
+"""
+import hashlib
+import os
+import re
+
+import numpy as np
+import scipy.sparse as sp
+from sklearn.feature_extraction.text import (ENGLISH_STOP_WORDS, HashingVectorizer, TfidfTransformer,
+                                             TfidfVectorizer)
+from sklearn.utils import murmurhash3_32
+
+CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'features_cache')
+TOKEN_PATTERN = r"(?u)\b\w\w+\b"
+# Change it when the format of the cache changes
+VERSION = 1
+
+
+def corpus_key(texts):
+    """Key of a corpus in the cache: digest of its texts (in order) and of
+    the tokenizer. A corpus sampled at random gets a new key on each run."""
+    h = hashlib.sha1('{}\0{}\0'.format(VERSION, TOKEN_PATTERN).encode('utf-8'))
+    for text in texts:
+        h.update(str(text).encode('utf-8'))
+        h.update(b'\0')
+    return h.hexdigest()
+
+
+def _save(path, **arrays):
+    """Write arrays to path, atomically."""
+    if not os.path.exists(CACHE_DIR):
+        os.makedirs(CACHE_DIR)
+    tmp = path + '.tmp.npz'
+    np.savez(tmp, **arrays)
+    os.replace(tmp, path)
+
+
+def tokenize(texts, key=None):
+    """Token stream of a corpus: (terms, ids, offsets).
+
+    terms is the list of the distinct tokens, ids the id of every token of
+    the corpus, one document after the other, and the tokens of document n
+    are ids[offsets[n]:offsets[n + 1]].
+    """
+    key = key or corpus_key(texts)
+    path = os.path.join(CACHE_DIR, 'tokens-{}.npz'.format(key))
+    if os.path.exists(path):
+        with np.load(path) as f:
+            terms = f['terms'].tobytes().decode('utf-8').split('\n') if f['terms'].size else []
+            return terms, f['ids'], f['offsets']
+
+    pattern = re.compile(TOKEN_PATTERN)
+    vocabulary = {}
+    ids = []
+    offsets = [0]
+    for text in texts:
+        for token in pattern.findall(str(text)):
+            ids.append(vocabulary.setdefault(token, len(vocabulary)))
+        offsets.append(len(ids))
+    terms = sorted(vocabulary, key=vocabulary.get)
+    ids = np.array(ids, dtype=np.int32)
+    offsets = np.array(offsets, dtype=np.int64)
+
+    # Terms are words, they never contain a new line
+    _save(path, terms=np.frombuffer('\n'.join(terms).encode('utf-8'), dtype=np.uint8),
+          ids=ids, offsets=offsets)
+    return terms, ids, offsets
+
+
+def _relabel(terms, new_terms, ids):
+    """Map token ids to the ids of new_terms (new_terms[i] for each term i)."""
+    unique = {}
+    mapping = np.array([unique.setdefault(t, len(unique)) for t in new_terms], dtype=np.int32)
+    return sorted(unique, key=unique.get), mapping[ids] if len(ids) else ids
+
+
+def _variant(terms, ids, offsets, stop_words, ngram_range, lowercase):
+    """Count matrix of one vectorizer configuration from a token stream, and
+    the terms of its columns."""
+    n_docs = len(offsets) - 1
+    docs = np.repeat(np.arange(n_docs), np.diff(offsets))
+
+    if lowercase:
+        terms, ids = _relabel(terms, [t.lower() for t in terms], ids)
+
+    if stop_words:
+        stop = np.array([t in stop_words for t in terms], dtype=bool)
+        keep = ~stop[ids] if len(ids) else np.zeros(0, dtype=bool)
+        ids, docs = ids[keep], docs[keep]
+
+    if ngram_range == (1, 1):
+        columns = ids
+    elif ngram_range == (2, 2):
+        # Pairs of consecutive tokens of the same document
+        same = docs[:-1] == docs[1:]
+        pairs = ids[:-1][same].astype(np.int64) * len(terms) + ids[1:][same]
+        docs = docs[:-1][same]
+        codes, columns = np.unique(pairs, return_inverse=True)
+        terms = ['{} {}'.format(terms[c // len(terms)], terms[c % len(terms)]) for c in codes]
+    else:
+        raise ValueError('Only unigrams or bigrams are supported, not {}'.format(ngram_range))
+
+    # Only the terms present are kept, in alphabetical order like sklearn
+    present = np.unique(columns)
+    order = sorted(present, key=lambda c: terms[c])
+    rank = np.zeros(len(terms), dtype=np.int64)
+    rank[order] = np.arange(len(order))
+    X = sp.coo_matrix((np.ones(len(columns), dtype=np.int64), (docs, rank[columns])),
+                      shape=(n_docs, len(order)))
+    return X.tocsr(), [terms[c] for c in order]
+
+
+def _hash(X, terms, n_features, alternate_sign=True):
+    """Count matrix X with the columns of terms hashed like HashingVectorizer."""
+    hashes = np.array([murmurhash3_32(t, seed=0) for t in terms], dtype=np.int64)
+    signs = np.where((hashes >= 0) | (not alternate_sign), 1, -1)
+    # Summed through a COO matrix, colliding terms cancelling out stay stored
+    # (as explicit zeros) like in HashingVectorizer, they count in the IDF
+    X = X.tocoo()
+    X = sp.coo_matrix((X.data * signs[X.col], (X.row, np.abs(hashes[X.col]) % n_features)),
+                      shape=(X.shape[0], n_features)).tocsr()
+    X.sort_indices()
+    return X
+
+
+def vectorize(texts, vectorizer, key=None):
+    """Matrix the vectorizer (CountVectorizer, TfidfVectorizer or a pipeline
+    of a HashingVectorizer and a TfidfTransformer) would give with
+    fit_transform(texts), computed from the cached token stream.
+
+    Only the parameters used by the grid are taken into account: stop_words
+    (None or 'english'), ngram_range ((1, 1) or (2, 2)) and lowercase, the
+    TF-IDF parameters (norm, use_idf, smooth_idf, sublinear_tf) and
+    n_features for the hashing vectorizer.
+    """
+    key = key or corpus_key(texts)
+    n_features = None
+    if hasattr(vectorizer, 'steps'):
+        hashing, transformer = [step for _, step in vectorizer.steps]
+        if not isinstance(hashing, HashingVectorizer) or hashing.norm is not None \
+                or getattr(hashing, 'non_negative', False):
+            raise ValueError('Only a signed HashingVectorizer without norm can be hashed')
+        n_features = hashing.n_features
+        alternate_sign = getattr(hashing, 'alternate_sign', True)
+        params = dict(hashing.get_params(), **transformer.get_params())
+        tfidf = True
+    else:
+        params = vectorizer.get_params()
+        tfidf = isinstance(vectorizer, TfidfVectorizer)
+    name = '{}-{}-{}{}-{}-{}'.format(key, params['stop_words'], params['ngram_range'][0],
+                                      params['ngram_range'][1], params['lowercase'],
+                                      'tfidf' if tfidf else 'tf')
+    if tfidf:
+        name += '-{}-{}-{}-{}'.format(params['norm'], params['use_idf'], params['smooth_idf'],
+                                      params['sublinear_tf'])
+    if n_features:
+        name += '-hash{}{}'.format(n_features, '' if alternate_sign else 'u')
+    path = os.path.join(CACHE_DIR, 'matrix-{}.npz'.format(name))
+    if os.path.exists(path):
+        with np.load(path) as f:
+            return sp.csr_matrix((f['data'], f['indices'], f['indptr']), shape=tuple(f['shape']))
+
+    stop_words = ENGLISH_STOP_WORDS if params['stop_words'] == 'english' else params['stop_words']
+    terms, ids, offsets = tokenize(texts, key)
+    X, terms = _variant(terms, ids, offsets, stop_words, tuple(params['ngram_range']),
+                        params['lowercase'])
+    if n_features:
+        X = _hash(X, terms, n_features, alternate_sign)
+    if tfidf:
+        X = TfidfTransformer(norm=params['norm'], use_idf=params['use_idf'],
+                             smooth_idf=params['smooth_idf'],
+                             sublinear_tf=params['sublinear_tf']).fit_transform(X)
+
+    _save(path, data=X.data, indices=X.indices, indptr=X.indptr, shape=np.array(X.shape))
+    return X
@@ -1,115 +1,145 @@
 import pandas as pd
 import numpy as np
-from sklearn.feature_extraction.text import CountVectorizer, TfidfVectorizer
+from sklearn.feature_extraction.text import CountVectorizer, HashingVectorizer, TfidfTransformer, TfidfVectorizer
+from sklearn.pipeline import make_pipeline
 from sklearn.model_selection import GridSearchCV, train_test_split
 from sklearn import svm
 import pickle
 
 from sklearn.naive_bayes import MultinomialNB
-from sklearn.metrics import classification_report
+from sklearn.metrics import precision_recall_fscore_support
 
 from sklearn.utils import shuffle
 
-print('PROGRAM STARTED')
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import csv
+import os
+import resource
+import sys
+import time
+
+import features
 
 SEED = 42
 TRAIN_TEST_RATIO = 0.2
+# Number of processes used to run the grid
+N_JOBS = os.cpu_count()
+# Tables of the results (vocabulary and hashing vectorizers), one line appended
+# per (dataset, vectorizer, model)
+RESULTS_FILE = 'results.csv'
+HASHING_RESULTS_FILE = 'results_hashing.csv'
+
+# Annotated datasets: file, encoding, columns of the text and of the label, and
+# mapping of the labels to {-1; 0; 1} (labels not mapped are not relevant)
+DATASETS = {
+    'self-drive': {
+        'file': '../data/Twitter-sentiment-self-drive-DFE.csv', 'encoding': 'latin1',
+        'text': 'text', 'label': 'sentiment',
+        'mapping': {'1':-1, '2':-1, '3':0, '4':1, '5':1}},
+    'text-emotion': {
+        'file': '../data/text_emotion.csv', 'encoding': None,
+        'text': 'content', 'label': 'sentiment',
+        'mapping': {
+            'sadness':-1,
+            'enthusiasm':1,
+            'neutral':0,
+            'worry':-1,
+            'surprise':1,
+            'love':1,
+            'fun':1,
+            'hate':-1,
+            'happiness':1,
+            'boredom':-1,
+            'relief':1,
+            'anger':-1}},
+    'apple': {
+        'file': '../data/Apple-Twitter-Sentiment-DFE.csv', 'encoding': 'latin1',
+        'text': 'text', 'label': 'sentiment',
+        'mapping': {'1':-1, '3':0, '5':1}},
+    'airline': {
+        'file': '../data/Airline-Sentiment-2-w-AA.csv', 'encoding': 'latin1',
+        'text': 'text', 'label': 'airline_sentiment',
+        'mapping': {'negative':-1, 'neutral':0, 'positive':1}},
+}
+# Classes of the production model ({-1; 0; 1} => {1; 3; 5})
+CLASSES = {-1:1, 0:3, 1:5}
+# Number of tweets of each class in the balanced dataset
+SAMPLE_SIZE = 18144 # Number of neutral occurences
 
-# ============================================================================
-# ============================================================================
-# ============================== self-drive ===================================
-df_sd = pd.read_csv('../data/Twitter-sentiment-self-drive-DFE.csv', encoding='latin1')
-
-# remove not relevant tweets
-df_sd = df_sd[~df_sd['sentiment'].isin(['not_relevant'])]
 
-# create the main dataframe by extracting the relevant rows
-df = pd.concat([df_sd['text'], df_sd['sentiment']], axis=1, keys=['text', 'sentiment'])
+def load_datasets():
+    """Load the annotated tweets.
 
-# normalize the sentiment values ({1; 2; 3; 4; 5} => {-1; 0; 1})
-df['sentiment'] = df['sentiment'].map({'1':-1, '2':-1, '3':0, '4':1, '5':1})
+    Returns the list of the dataframes (self-drive, text-emotion, apple,
+    airline and all of them together, balanced).
+    """
+    # ============================================================================
+    # ============================================================================
+    # ============================== self-drive ===================================
+    df_sd = pd.read_csv(DATASETS['self-drive']['file'], encoding='latin1')
 
-# shuffle the data
-df = shuffle(df, random_state=SEED)
+    # remove not relevant tweets
+    df_sd = df_sd[~df_sd['sentiment'].isin(['not_relevant'])]
 
-# append the rows to the main dataframe
-df_sd = df
+    # create the main dataframe by extracting the relevant rows
+    df = pd.concat([df_sd['text'], df_sd['sentiment']], axis=1, keys=['text', 'sentiment'])
 
-print('self-drive loaded')
+    # normalize the sentiment values ({1; 2; 3; 4; 5} => {-1; 0; 1})
+    df['sentiment'] = df['sentiment'].map(DATASETS['self-drive']['mapping'])
 
-# ============================== text-emotion =================================
-df_te = pd.read_csv('../data/text_emotion.csv')
-df_te = pd.concat([df_te['content'], df_te['sentiment']], axis=1, keys=['text', 'sentiment'])
+    # shuffle the data
+    df_sd = shuffle(df, random_state=SEED)
 
-# remove not relevant tweets
-df_te = df_te[~df_te['sentiment'].isin(['empty'])]
+    print('self-drive loaded')
 
-# map words into integer values ({...} => {-1; 0; 1})
-df_te['sentiment'] = df_te['sentiment'].map({
-    'sadness':-1,
-    'enthusiasm':1,
-    'neutral':0,
-    'worry':-1,
-    'surprise':1,
-    'love':1,
-    'fun':1,
-    'hate':-1,
-    'happiness':1,
-    'boredom':-1,
-    'relief':1,
-    'anger':-1})
+    # ============================== text-emotion =================================
+    df_te = pd.read_csv(DATASETS['text-emotion']['file'])
+    df_te = pd.concat([df_te['content'], df_te['sentiment']], axis=1, keys=['text', 'sentiment'])
 
-# shuffle the data
-df_te = shuffle(df_te, random_state=SEED)
+    # remove not relevant tweets
+    df_te = df_te[~df_te['sentiment'].isin(['empty'])]
 
-# append the rows to the main dataframe
-df = df.append(df_te)
-# del df_te
-print('text-emotion loaded')
+    # map words into integer values ({...} => {-1; 0; 1})
+    df_te['sentiment'] = df_te['sentiment'].map(DATASETS['text-emotion']['mapping'])
 
-# ================================= apple =====================================
-df_ap = pd.read_csv('../data/Apple-Twitter-Sentiment-DFE.csv', encoding='latin1')
-df_ap = pd.concat([df_ap['text'], df_ap['sentiment']], axis=1, keys=['text', 'sentiment'])
+    # shuffle the data
+    df_te = shuffle(df_te, random_state=SEED)
+    print('text-emotion loaded')
 
-# remove not relevant tweets
-df_ap = df_ap[~df_ap['sentiment'].isin(['not_relevant'])]
+    # ================================= apple =====================================
+    df_ap = pd.read_csv(DATASETS['apple']['file'], encoding='latin1')
+    df_ap = pd.concat([df_ap['text'], df_ap['sentiment']], axis=1, keys=['text', 'sentiment'])
 
-# normalize the sentiment values ({1; 3; 5} => {-1; 0; 1})
-df_ap['sentiment'] = df_ap['sentiment'].map({'1':-1, '3':0, '5':1})
+    # remove not relevant tweets
+    df_ap = df_ap[~df_ap['sentiment'].isin(['not_relevant'])]
 
-# shuffle the data
-df_ap = shuffle(df_ap, random_state=SEED)
+    # normalize the sentiment values ({1; 3; 5} => {-1; 0; 1})
+    df_ap['sentiment'] = df_ap['sentiment'].map(DATASETS['apple']['mapping'])
 
-# append the rows to the main dataframe
-df = df.append(df_ap)
-# del df_ap
-print('apple loaded')
+    # shuffle the data
+    df_ap = shuffle(df_ap, random_state=SEED)
+    print('apple loaded')
 
-# =============================== airline =====================================
-df_ai = pd.read_csv('../data/Airline-Sentiment-2-w-AA.csv', encoding='latin1')
-df_ai = pd.concat([df_ai['text'], df_ai['airline_sentiment']], axis=1, keys=['text', 'sentiment'])
+    # =============================== airline =====================================
+    df_ai = pd.read_csv(DATASETS['airline']['file'], encoding='latin1')
+    df_ai = pd.concat([df_ai['text'], df_ai['airline_sentiment']], axis=1, keys=['text', 'sentiment'])
 
-# normalize the sentiment values ({'negative'; 'neutral'; 'positive'} => {-1; 0; 1})
-df_ai['sentiment'] = df_ai['sentiment'].map({'negative':-1, 'neutral':0, 'positive':1})
+    # normalize the sentiment values ({'negative'; 'neutral'; 'positive'} => {-1; 0; 1})
+    df_ai['sentiment'] = df_ai['sentiment'].map(DATASETS['airline']['mapping'])
 
-# shuffle the data
-df_ai = shuffle(df_ai, random_state=SEED)
+    # shuffle the data
+    df_ai = shuffle(df_ai, random_state=SEED)
+    print('airline loaded')
 
-# append the rows to the main dataframe
-df = df.append(df_ai)
-# del df_ai
-print('airline loaded')
+    # main dataframe, concatenated once
+    df = pd.concat([df_sd, df_te, df_ap, df_ai])
+    df['sentiment'] = df['sentiment'].map(CLASSES)
 
-df['sentiment'] = df['sentiment'].map({-1:1, 0:3, 1:5})
+    df = pd.concat([df.loc[df['sentiment'] == c].sample(SAMPLE_SIZE, random_state=SEED) for c in (5, 3, 1)])
+    df = shuffle(df, random_state=SEED)
 
-SAMPLE_SIZE = 18144 # Number of neutral occurences
-df = df.loc[df['sentiment'] == 5].sample(SAMPLE_SIZE).append(df.loc[df['sentiment'] == 3].sample(SAMPLE_SIZE)).append(df.loc[df['sentiment'] == 1].sample(SAMPLE_SIZE))
-# df = df.loc[df['sentiment'] == 1].sample(SAMPLE_SIZE).append(df.loc[df['sentiment'] == 0].sample(SAMPLE_SIZE)).append(df.loc[df['sentiment'] == -1].sample(SAMPLE_SIZE))
-df = shuffle(df, random_state=SEED)
+    return [df_sd, df_te, df_ap, df_ai, df]
 
-# ============================================================================
-# ============================================================================
-print('dataframe shuffled, filtered. READY')
 
 # Array of vectorizers for the feature extraction step
 vecs = [
@@ -131,64 +161,151 @@ vecs = [
     TfidfVectorizer(stop_words=None, ngram_range=(2, 2), lowercase=False)
 ]
 
-dfs = [df_sd, df_te, df_ap, df_ai, df]
-# dfs = [df_sd[:200]]
+# Hashing mode (--hashing): fixed width TF-IDF features without vocabulary,
+# signed hashing of the terms then the IDF of the training set
+N_HASH_FEATURES = 2 ** 18
+hashing_vecs = [
+    make_pipeline(HashingVectorizer(n_features=N_HASH_FEATURES, norm=None, stop_words=stop_words,
+                                    ngram_range=ngram_range, lowercase=lowercase),
+                  TfidfTransformer())
+    for stop_words in ('english', None) for ngram_range in ((1, 1), (2, 2)) for lowercase in (True, False)
+]
 
-results = {'linear': [], 'rbf': [], 'nb': []}
-# results_svm = []
-# results_rbf = []
-# results_nb = []
-target_names = ['negative', 'neutral', 'positive']
+# Classifiers evaluated on every vectorizer
+models = {'linear': svm.LinearSVC, 'rbf': svm.SVC, 'nb': MultinomialNB}
 
-print('LOOP DF START')
-for i in range(len(dfs)):
-    print('Loop df numero : {}'.format(i))
-    results_df_svm = []
-    results_df_rbf = []
-    results_df_nb = []
-
-    threshold = int(TRAIN_TEST_RATIO*len(dfs[i]))
-
-    print('LOOP VEC START')
-    for idx, vec in enumerate(vecs):
-        print('Loop vec numero : {}'.format(idx))
-        print('======== LOOP NUMBER {} ========'.format(i*len(vecs) + idx))
-        current_vec = vec
-        X, y = current_vec.fit_transform(dfs[i]['text'].as_matrix()).toarray(), dfs[i]['sentiment'].as_matrix()
-
-        # SVM Linear
-        print('SVM linear start')
-        svm_linear = svm.LinearSVC()
-        y_pred = svm_linear.fit(X[:threshold], y[:threshold]).predict(X[threshold:])
-        results_df_svm.append(classification_report(y[threshold:], y_pred, target_names=target_names))
-        print('SVM linear finished')
-
-        # SVM RBF
-        if (i+1 != len(dfs)):
-            print('SVM rbf start')
-            svm_rbf = svm.SVC()
-            y_pred = svm_rbf.fit(X[:threshold], y[:threshold]).predict(X[threshold:])
-            results_df_rbf.append(classification_report(y[threshold:], y_pred, target_names=target_names))
-            print('SVM rbf finished')
-
-        # Naive Bayes
-        print('NB start')
-        gnb = MultinomialNB()
-        y_pred = gnb.fit(X[:threshold], y[:threshold]).predict(X[threshold:])
-        results_df_nb.append(classification_report(y[threshold:], y_pred, target_names=target_names))
-        print('NB finished')
-
-    results['linear'].append(results_df_svm)
-    results['rbf'].append(results_df_rbf)
-    results['nb'].append(results_df_nb)
-    print('LOOP VEC FINISHED')
-
-print('LOOP DF FINISHED')
-
-print('Pickle started')
-pickle.dump(results, open( "results.p", "wb" ) )
-# pickle.dump(results_svm, open( "results_svm.p", "wb" ) )
-# pickle.dump(results_nb, open( "results_nb.p", "wb" ) )
-print('Pickle finished')
-
-print('PROGRAM FINISHED')
+target_names = ['negative', 'neutral', 'positive']
+dataset_names = ['self-drive', 'text-emotion', 'apple', 'airline', 'all']
+
+# Columns of the results file, 'avg' is the average weighted by the support
+METRICS = ['precision', 'recall', 'f1', 'support']
+COLUMNS = ['dataset', 'vectorizer', 'model', 'fit_time', 'predict_time'] + \
+    ['{}_{}'.format(metric, c) for c in target_names + ['avg'] for metric in METRICS]
+
+
+def featurize(i, texts, vectorizers=vecs):
+    """Sparse features of the dataset i with every vectorizer.
+
+    The texts are tokenized once and the matrices cached on disk (see
+    features.py), a second run only loads them.
+    """
+    key = features.corpus_key(texts)
+    return i, [features.vectorize(texts, vec, key) for vec in vectorizers]
+
+
+def train(dataset, idx, name, X, y):
+    """Train the model name on the features X of a dataset and return the
+    line of the results file: scores on the test set and timings."""
+    threshold = int(TRAIN_TEST_RATIO*len(y))
+    model = models[name]()
+
+    start = time.time()
+    model.fit(X[:threshold], y[:threshold])
+    fit_time = time.time() - start
+    start = time.time()
+    y_pred = model.predict(X[threshold:])
+    predict_time = time.time() - start
+
+    row = {'dataset': dataset, 'vectorizer': idx, 'model': name,
+           'fit_time': fit_time, 'predict_time': predict_time}
+    scores = precision_recall_fscore_support(y[threshold:], y_pred, labels=np.unique(y))
+    for c, values in zip(target_names, zip(*scores)):
+        for metric, value in zip(METRICS, values):
+            row['{}_{}'.format(metric, c)] = value
+    support = scores[3]
+    for metric, values in zip(METRICS[:3], scores[:3]):
+        row['{}_avg'.format(metric)] = np.average(values, weights=support)
+    row['support_avg'] = support.sum()
+    return row
+
+
+def load_done(path):
+    """Cells (dataset, vectorizer, model) already in the results file.
+
+    A line cut by a crash is removed, so that the file can be appended again.
+    """
+    if not os.path.exists(path):
+        return set()
+    with open(path, 'rb+') as f:
+        content = f.read()
+        if content and not content.endswith(b'\n'):
+            f.truncate(content.rfind(b'\n') + 1)
+    with open(path, newline='') as f:
+        return {(row['dataset'], int(row['vectorizer']), row['model'])
+                for row in csv.DictReader(f)}
+
+
+def run_grid(dfs, names=dataset_names, n_jobs=N_JOBS, path=RESULTS_FILE, vectorizers=vecs):
+    """Evaluate every (dataset, vectorizer, model) on a pool of processes.
+
+    The features stay sparse. Each dataset is vectorized once, in the pool,
+    and each resulting matrix is shared by the jobs training the models on it.
+
+    Each result is appended to the results file as soon as it is finished.
+    The cells already in the file are skipped, so an interrupted run can be
+    resumed by starting it again.
+    """
+    done = load_done(path)
+    todo = {}
+    for i, dataset in enumerate(names[:len(dfs)]):
+        for idx in range(len(vectorizers)):
+            for name in models:
+                # SVM RBF is too slow on the combined dataset
+                if name == 'rbf' and i + 1 == len(dfs):
+                    continue
+                # Naive Bayes needs non negative features, signed hashing gives negative ones
+                if name == 'nb' and hasattr(vectorizers[idx], 'steps'):
+                    continue
+                if (dataset, idx, name) not in done:
+                    todo.setdefault(i, []).append((idx, name))
+    print('{} cells done, {} to do'.format(len(done), sum(len(cells) for cells in todo.values())))
+
+    new_file = not os.path.exists(path)
+    with open(path, 'a', newline='') as f, ProcessPoolExecutor(max_workers=n_jobs) as pool:
+        writer = csv.DictWriter(f, fieldnames=COLUMNS)
+        if new_file:
+            writer.writeheader()
+
+        featurized = [pool.submit(featurize, i, dfs[i]['text'].values, vectorizers) for i in todo]
+
+        jobs = []
+        for future in as_completed(featurized):
+            i, matrices = future.result()
+            y = dfs[i]['sentiment'].values
+            for idx, name in todo[i]:
+                X = matrices[idx]
+                jobs.append(pool.submit(train, names[i], idx, name, X, y))
+
+        for future in as_completed(jobs):
+            row = future.result()
+            print('{} finished on {} with vec {} : f1 {:.2f}'.format(row['model'], row['dataset'], row['vectorizer'], row['f1_avg']))
+            writer.writerow(row)
+            f.flush()
+            os.fsync(f.fileno())
+
+
+if __name__ == '__main__':
+    print('PROGRAM STARTED')
+    start = time.time()
+
+    dfs = load_datasets()
+    # dfs = [dfs[0][:200]]
+    print('dataframe shuffled, filtered. READY')
+
+    # python modelselection.py --hashing evaluates the hashing vectorizers
+    if '--hashing' in sys.argv[1:]:
+        vectorizers, path = hashing_vecs, HASHING_RESULTS_FILE
+    else:
+        vectorizers, path = vecs, RESULTS_FILE
+
+    print('GRID START')
+    run_grid(dfs, path=path, vectorizers=vectorizers)
+    print('GRID FINISHED, results in {}'.format(path))
+
+    # ru_maxrss is in kilobytes on Linux, RUSAGE_CHILDREN gives the largest worker
+    print('Wall time : {:.1f} s'.format(time.time() - start))
+    print('Peak memory : main {:.0f} MB, largest worker {:.0f} MB'.format(
+        resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024))
+
+    print('PROGRAM FINISHED')
@@ -0,0 +1,123 @@
+"""
+Streaming training of the production model.
+
+The annotated datasets are read in chunks and never loaded whole: the
+labels are mapped like in modelselection.py, and the tweets of each class
+are sampled with a reservoir of SAMPLE_SIZE tweets, so the memory used
+does not grow with the corpus. The balanced sample is then featurized with
+a HashingVectorizer (no vocabulary to keep) and a linear SVM (SGD with the
+hinge loss) is fitted on it incrementally, mini-batch by mini-batch, with
+partial_fit.
+
+The model is written as a pickle of (classifier, vectorizer), like the
+production pickle. Sentiment serves the exported model (MODEL_DIR) when it
+exists, so to deploy this one, export it over the exported model, from
+src/server:
+
+    python export_model.py ../modelselection/opistocks_classifier_vectorizer_streaming.pickle
+
+Usage: python train_streaming.py [output_file]
+"""
+import os
+import pickle
+import random
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+from sklearn.feature_extraction.text import HashingVectorizer
+from sklearn.linear_model import SGDClassifier
+from sklearn.metrics import classification_report
+
+from modelselection import CLASSES, DATASETS, SAMPLE_SIZE, SEED, target_names
+
+CHUNK_SIZE = 10000
+BATCH_SIZE = 1000
+N_EPOCHS = 5
+TEST_RATIO = 0.2
+N_FEATURES = 2 ** 20
+OUTPUT_FILE = 'opistocks_classifier_vectorizer_streaming.pickle'
+
+
+def read_tweets(datasets=DATASETS, chunksize=CHUNK_SIZE):
+    """Yield (text, class) of every relevant tweet of the datasets, chunk by
+    chunk. The classes are the ones of the production model (1, 3, 5)."""
+    for name, spec in datasets.items():
+        if not os.path.exists(spec['file']):
+            print('{} not found, skipped'.format(spec['file']))
+            continue
+        chunks = pd.read_csv(spec['file'], encoding=spec['encoding'], chunksize=chunksize,
+                             usecols=[spec['text'], spec['label']], dtype={spec['label']: str})
+        for chunk in chunks:
+            labels = chunk[spec['label']].map(spec['mapping']).map(CLASSES)
+            relevant = labels.notnull()
+            yield from zip(chunk[spec['text']][relevant].astype(str), labels[relevant].astype(int))
+        print('{} read'.format(name))
+
+
+def reservoir_sample(tweets, size=SAMPLE_SIZE, seed=SEED):
+    """Uniform sample of at most size tweets of each class, in one pass.
+
+    Returns {class: [texts]}.
+    """
+    rng = random.Random(seed)
+    reservoirs = {}
+    seen = {}
+    for text, label in tweets:
+        reservoir = reservoirs.setdefault(label, [])
+        seen[label] = seen.get(label, 0) + 1
+        if len(reservoir) < size:
+            reservoir.append(text)
+        else:
+            j = rng.randrange(seen[label])
+            if j < size:
+                reservoir[j] = text
+    for label in sorted(seen):
+        print('class {} : {} tweets, {} sampled'.format(label, seen[label], len(reservoirs[label])))
+    return reservoirs
+
+
+def train(reservoirs, seed=SEED):
+    """Fit the vectorizer and the classifier on the balanced sample.
+
+    Returns (classifier, vectorizer, test texts, test labels).
+    """
+    # Same number of tweets in each class
+    size = min(len(r) for r in reservoirs.values())
+    texts = []
+    labels = []
+    for label, reservoir in sorted(reservoirs.items()):
+        texts.extend(reservoir[:size])
+        labels.extend([label] * size)
+
+    rng = np.random.RandomState(seed)
+    order = rng.permutation(len(texts))
+    texts = [texts[i] for i in order]
+    labels = np.array(labels)[order]
+    threshold = int((1 - TEST_RATIO) * len(texts))
+
+    vectorizer = HashingVectorizer(n_features=N_FEATURES, lowercase=False)
+    classifier = SGDClassifier(loss='hinge', random_state=seed)
+    classes = np.unique(labels)
+    for epoch in range(N_EPOCHS):
+        for start in range(0, threshold, BATCH_SIZE):
+            end = min(start + BATCH_SIZE, threshold)
+            X = vectorizer.transform(texts[start:end])
+            classifier.partial_fit(X, labels[start:end], classes=classes)
+        print('epoch {} finished'.format(epoch))
+    return classifier, vectorizer, texts[threshold:], labels[threshold:]
+
+
+if __name__ == '__main__':
+    output_file = sys.argv[1] if len(sys.argv) > 1 else OUTPUT_FILE
+    start = time.time()
+
+    reservoirs = reservoir_sample(read_tweets())
+    classifier, vectorizer, test_texts, test_labels = train(reservoirs)
+
+    y_pred = classifier.predict(vectorizer.transform(test_texts))
+    print(classification_report(test_labels, y_pred, target_names=target_names))
+
+    pickle.dump((classifier, vectorizer), open(output_file, 'wb'))
+    print('Model written to {} in {:.1f} s'.format(output_file, time.time() - start))
@@ -0,0 +1,131 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Comparison of the vocabulary model (TfidfVectorizer, as in production)
+against the hashing model (HashingVectorizer and TfidfTransformer) on the
+annotated tweets of src/data.
+
+Both are trained with a LinearSVC on the same split and compared on:
+accuracy and weighted F1, size, load time and memory of the pickle and of
+the exported model, and time per tweet of the features and of the
+prediction (sklearn and inference engine).
+
+Usage (from src/server): python benchmarks/bench_hashing.py [n_features]
+"""
+import os
+import pickle
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import pandas as pd
+from sklearn.feature_extraction.text import HashingVectorizer, TfidfTransformer, TfidfVectorizer
+from sklearn.metrics import accuracy_score, f1_score
+from sklearn.pipeline import make_pipeline
+from sklearn.svm import LinearSVC
+from sklearn.utils import shuffle
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import BASE_DIR
+from opistocks.Inference import InferenceEngine
+from opistocks.Model import export_model, load_model
+
+DATA_DIR = os.path.join(BASE_DIR, '..', 'data')
+# File, column of the text and of the label, mapping of the labels to the classes
+DATASETS = [
+    ('Airline-Sentiment-2-w-AA.csv', 'text', 'airline_sentiment',
+     {'negative': 1, 'neutral': 3, 'positive': 5}),
+    ('Apple-Twitter-Sentiment-DFE.csv', 'text', 'sentiment', {'1': 1, '3': 3, '5': 5}),
+    ('Twitter-sentiment-self-drive-DFE.csv', 'text', 'sentiment',
+     {'1': 1, '2': 1, '3': 3, '4': 5, '5': 5}),
+]
+SEED = 42
+TEST_RATIO = 0.2
+N_FEATURES = 2 ** 18
+N_SINGLE = 2000
+
+
+def timeit(f, *args):
+    start = time.perf_counter()
+    result = f(*args)
+    return result, time.perf_counter() - start
+
+
+def load_tweets():
+    frames = []
+    for name, text, label, mapping in DATASETS:
+        df = pd.read_csv(os.path.join(DATA_DIR, name), encoding='latin1', dtype={label: str})
+        df = pd.DataFrame({'text': df[text].astype(str), 'label': df[label].map(mapping)})
+        frames.append(df.dropna())
+    df = shuffle(pd.concat(frames), random_state=SEED)
+    return df['text'].tolist(), df['label'].astype(int).values
+
+
+def directory_size(directory):
+    return sum(os.path.getsize(os.path.join(directory, f)) for f in os.listdir(directory))
+
+
+def measure(name, vectorizer, train, test, y_train, y_test, tmp):
+    classifier = LinearSVC().fit(vectorizer.fit_transform(train), y_train)
+    y_pred = classifier.predict(vectorizer.transform(test))
+
+    pickle_file = os.path.join(tmp, name + '.pickle')
+    with open(pickle_file, 'wb') as f:
+        pickle.dump((classifier, vectorizer), f)
+    tracemalloc.start()
+    _, t_pickle = timeit(lambda: pickle.load(open(pickle_file, 'rb')))
+    _, m_pickle = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    model_dir = os.path.join(tmp, name)
+    export_model(classifier, vectorizer, model_dir)
+    tracemalloc.start()
+    (m_classifier, m_vectorizer), t_mmap = timeit(load_model, model_dir)
+    engine, t_engine = timeit(InferenceEngine, m_classifier, m_vectorizer)
+    _, m_mmap = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    single = test[:N_SINGLE]
+    _, t_transform = timeit(lambda: [vectorizer.transform([t]) for t in single])
+    _, t_mapped = timeit(lambda: [m_vectorizer.transform([t]) for t in single])
+    labels, t_engine_single = timeit(lambda: [engine.predict([t])[0] for t in single])
+    mismatches = sum(a != b for a, b in zip(labels, classifier.predict(vectorizer.transform(single))))
+
+    print('{}:'.format(name))
+    print('  accuracy {:.4f}, weighted F1 {:.4f}'.format(
+        accuracy_score(y_test, y_pred), f1_score(y_test, y_pred, average='weighted')))
+    print('  pickle {:.0f} KB, load {:.1f} ms, {:.1f} MB allocated'.format(
+        os.path.getsize(pickle_file) / 1024, 1e3 * t_pickle, m_pickle / 2 ** 20))
+    print('  export {:.0f} KB, load {:.1f} ms (+ engine {:.1f} ms), {:.1f} MB allocated'.format(
+        directory_size(model_dir) / 1024, 1e3 * t_mmap, 1e3 * t_engine, m_mmap / 2 ** 20))
+    print('  features of one tweet: sklearn {:.1f} us, mapped {:.1f} us'.format(
+        1e6 * t_transform / len(single), 1e6 * t_mapped / len(single)))
+    print('  prediction of one tweet: engine {:.1f} us, {} mismatches with sklearn'.format(
+        1e6 * t_engine_single / len(single), mismatches))
+    return mismatches
+
+
+if __name__ == '__main__':
+    n_features = int(sys.argv[1]) if len(sys.argv) > 1 else N_FEATURES
+    tweets, y = load_tweets()
+    threshold = int(TEST_RATIO * len(tweets))
+    test, train = tweets[:threshold], tweets[threshold:]
+    y_test, y_train = y[:threshold], y[threshold:]
+    print('{} tweets for training, {} for testing'.format(len(train), len(test)))
+
+    tmp = tempfile.mkdtemp()
+    try:
+        mismatches = measure('vocabulary', TfidfVectorizer(lowercase=False),
+                             train, test, y_train, y_test, tmp)
+        mismatches += measure('hashing ({} features)'.format(n_features),
+                              make_pipeline(HashingVectorizer(n_features=n_features, norm=None,
+                                                              lowercase=False),
+                                            TfidfTransformer()),
+                              train, test, y_train, y_test, tmp)
+    finally:
+        shutil.rmtree(tmp)
+    sys.exit(1 if mismatches else 0)
@@ -0,0 +1,86 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Micro-benchmark of the ingestion of a price history downloaded from Yahoo
+and of its serialisation, on synthetic histories of 1k, 10k and 100k rows.
+
+    - parsing: per-row date conversion (previous code) against parse_history
+    - serialisation: json.dumps of the list of [date, value] pairs (previous
+      code) against the chunked encodings of the responses
+
+Usage (from src/server): python benchmarks/bench_history.py
+"""
+import io
+import json
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from opistocks import Encoding
+from opistocks.Stocks import parse_history
+
+SIZES = [1000, 10000, 100000]
+REPEAT = 3
+
+
+def best_time(f, *args, repeat=REPEAT):
+    """Best time of repeat calls and the result of the last one."""
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = f(*args)
+        times.append(time.perf_counter() - start)
+    return result, min(times)
+
+
+def yahoo_csv(n_rows):
+    """History of n_rows days in the CSV format of Yahoo."""
+    days = pd.date_range('1900-01-01', periods=n_rows, freq='D')
+    values = 10 + np.random.RandomState(0).rand(n_rows)
+    df = pd.DataFrame({'Date': days.strftime('%Y-%m-%d'), 'Open': values, 'High': values,
+                       'Low': values, 'Close': values, 'Adj Close': values,
+                       'Volume': np.arange(n_rows)})
+    return df.to_csv(index=False)
+
+
+def parse_per_row(csv):
+    """Previous parsing of Stocks.download."""
+    df = pd.read_csv(io.StringIO(csv), index_col=0)['Adj Close']
+    dates = [int(pd.to_datetime(x).strftime("%Y%m%d")) for x in df.index.values.tolist()]
+    return np.array(dates, dtype=np.int32), df.values.astype(np.float64)
+
+
+def dumps_pairs(dates, values):
+    """Previous serialisation of the routes."""
+    return json.dumps([list(a) for a in zip(dates.tolist(), values.tolist())])
+
+
+def encode(dates, values, mimetype):
+    return b''.join(c.encode('utf-8') if isinstance(c, str) else c
+                    for c in Encoding.encode(dates, values, mimetype))
+
+
+if __name__ == '__main__':
+    for n_rows in SIZES:
+        csv = yahoo_csv(n_rows)
+        # The per row parsing takes seconds on the largest history, run once
+        (old_dates, old_values), t_old = best_time(parse_per_row, csv, repeat=1)
+        (dates, values), t_new = best_time(parse_history, csv)
+        assert np.array_equal(old_dates, dates) and np.array_equal(old_values, values)
+        print('{} rows'.format(n_rows))
+        print('  parsing: per row {:.1f} ms, vectorized {:.1f} ms ({:.0f}x)'.format(
+            1e3 * t_old, 1e3 * t_new, t_old / t_new))
+
+        text, t_pairs = best_time(dumps_pairs, dates, values)
+        for mimetype in Encoding.FORMATS:
+            body, t_encode = best_time(encode, dates, values, mimetype)
+            if mimetype == Encoding.JSON:
+                assert body.decode('utf-8') == text
+            print('  {}: {:.1f} ms, {:.0f} KB (json.dumps of pairs {:.1f} ms)'.format(
+                mimetype, 1e3 * t_encode, len(body) / 1024, 1e3 * t_pairs))
@@ -0,0 +1,66 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Benchmark of the sentiment prediction: sklearn pickle against the
+inference engine on the memory mapped model.
+
+Checks that both paths give the same labels on the annotated tweets of
+src/data and reports the time per tweet, one by one and in batch.
+
+Usage (from src/server): python benchmarks/bench_inference.py
+"""
+import os
+import pickle
+import sys
+import time
+
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import BASE_DIR, MODEL_DIR, PICKLE_FILE
+from opistocks.Inference import InferenceEngine
+from opistocks.Model import load_model
+
+DATA_DIR = os.path.join(BASE_DIR, '..', 'data')
+DATASETS = ['Airline-Sentiment-2-w-AA.csv',
+            'Apple-Twitter-Sentiment-DFE.csv',
+            'Twitter-sentiment-self-drive-DFE.csv']
+N_SINGLE = 2000
+
+
+def timeit(f, *args):
+    start = time.perf_counter()
+    result = f(*args)
+    return result, time.perf_counter() - start
+
+
+if __name__ == '__main__':
+    tweets = []
+    for name in DATASETS:
+        df = pd.read_csv(os.path.join(DATA_DIR, name), encoding='latin1')
+        tweets.extend(df['text'].astype(str).tolist())
+
+    (classifier, vectorizer), t_pickle = timeit(lambda: pickle.load(open(PICKLE_FILE, 'rb')))
+    (m_classifier, m_vectorizer), t_mmap = timeit(load_model, MODEL_DIR)
+    engine, t_engine = timeit(InferenceEngine, m_classifier, m_vectorizer)
+    print('Load: pickle {:.1f} ms, mmap {:.1f} ms (+ engine {:.1f} ms)'.format(
+        1e3 * t_pickle, 1e3 * t_mmap, 1e3 * t_engine))
+
+    def sklearn_predict(batch):
+        return [int(str(x)) for x in classifier.predict(vectorizer.transform(batch))]
+
+    expected, t_sk = timeit(sklearn_predict, tweets)
+    labels, t_en = timeit(engine.predict, tweets)
+    mismatches = sum(a != b for a, b in zip(expected, labels))
+    print('Batch of {} tweets: sklearn {:.1f} us/tweet, engine {:.1f} us/tweet, {} mismatches'.format(
+        len(tweets), 1e6 * t_sk / len(tweets), 1e6 * t_en / len(tweets), mismatches))
+
+    single = tweets[:N_SINGLE]
+    _, t_sk = timeit(lambda: [sklearn_predict([t]) for t in single])
+    _, t_en = timeit(lambda: [engine.predict([t]) for t in single])
+    print('One by one: sklearn {:.1f} us/tweet, engine {:.1f} us/tweet'.format(
+        1e6 * t_sk / len(single), 1e6 * t_en / len(single)))
+
+    sys.exit(1 if mismatches else 0)
@@ -0,0 +1,221 @@
+# -*- coding: utf-8 -*-
+
+"""
+Local stand-ins for Yahoo Finance (history, download and quote of the
+name of a symbol) and the Twitter search API, serving fixtures with a
+configurable latency, for the benchmarks.
+
+The fixtures are the recorded responses of a directory if one is given:
+
+    yahoo/<SYMBOL>.csv      history CSV of a symbol, as downloaded from Yahoo
+    twitter/statuses.json   list of statuses (JSON of the search API)
+
+Otherwise they are generated: a random walk of prices for each symbol and
+the annotated tweets of src/data, one every few minutes back from now.
+"""
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, HTTPServer
+import io
+import json
+import os
+import socketserver
+import threading
+import time
+from urllib.parse import parse_qs, urlparse
+
+import numpy as np
+import pandas as pd
+import requests
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), 'data')
+TWEETS_FILES = ['Airline-Sentiment-2-w-AA.csv', 'Apple-Twitter-Sentiment-DFE.csv',
+                'Twitter-sentiment-self-drive-DFE.csv']
+CRUMB = 'fixture'
+HISTORY_PAGE = '<html><script>"CrumbStore":{{"crumb":"{}"}}</script></html>'.format(CRUMB)
+TWITTER_DATE = '%a %b %d %H:%M:%S +0000 %Y'
+
+
+def generate_history(symbol, start='2000-01-01'):
+    """History CSV of symbol: random walk of the prices of the business days."""
+    days = pd.bdate_range(start, datetime.today())
+    rng = np.random.RandomState(sum(map(ord, symbol)))
+    prices = 50 * np.exp(np.cumsum(rng.normal(0, 0.01, len(days))))
+    df = pd.DataFrame({'Date': days.strftime('%Y-%m-%d'), 'Open': prices, 'High': prices,
+                       'Low': prices, 'Close': prices, 'Adj Close': prices,
+                       'Volume': rng.randint(1000, 100000, len(days))},
+                      columns=['Date', 'Open', 'High', 'Low', 'Close', 'Adj Close', 'Volume'])
+    return df.to_csv(index=False)
+
+
+def generate_statuses(every=timedelta(minutes=5)):
+    """Statuses of the annotated tweets, the newest first, one every few
+    minutes back from now."""
+    texts = []
+    for name in TWEETS_FILES:
+        texts.extend(pd.read_csv(os.path.join(DATA_DIR, name), encoding='latin1')['text'].astype(str))
+    now = datetime.utcnow()
+    return [{'id': len(texts) - i, 'text': text, 'created_at': (now - i * every).strftime(TWITTER_DATE)}
+            for i, text in enumerate(texts)]
+
+
+class Fixtures:
+    """Fixtures class
+
+    Responses of the fake upstream servers.
+    """
+
+    def __init__(self, symbols, directory=None):
+        self.histories = {}
+        for symbol in symbols:
+            path = os.path.join(directory or '', 'yahoo', symbol + '.csv')
+            if directory and os.path.exists(path):
+                with open(path) as f:
+                    self.histories[symbol] = pd.read_csv(f)
+            else:
+                self.histories[symbol] = pd.read_csv(io.StringIO(generate_history(symbol)))
+            dates = pd.to_datetime(self.histories[symbol]['Date'], format='%Y-%m-%d')
+            self.histories[symbol]['timestamp'] = (dates - pd.Timestamp(0)) // pd.Timedelta(seconds=1)
+
+        path = os.path.join(directory or '', 'twitter', 'statuses.json')
+        if directory and os.path.exists(path):
+            with open(path) as f:
+                self.statuses = json.load(f)
+        else:
+            self.statuses = generate_statuses()
+        self.statuses.sort(key=lambda s: -s['id'])
+        self.days = np.array([datetime.strptime(s['created_at'], TWITTER_DATE).strftime('%Y-%m-%d')
+                              for s in self.statuses])
+        self.ids = np.array([s['id'] for s in self.statuses])
+
+    def history(self, symbol, period1, period2):
+        """CSV of the history of symbol between two timestamps, None if unknown."""
+        df = self.histories.get(symbol)
+        if df is None:
+            return None
+        df = df[(df['timestamp'] >= period1) & (df['timestamp'] < period2)]
+        return df.drop('timestamp', axis=1).to_csv(index=False)
+
+    def search(self, count=15, until=None, max_id=None):
+        """Statuses created before the day until, with an id up to max_id."""
+        keep = np.ones(len(self.statuses), dtype=bool)
+        if until:
+            keep &= self.days < until
+        if max_id:
+            keep &= self.ids <= int(max_id)
+        return [self.statuses[i] for i in np.flatnonzero(keep)[:int(count)]]
+
+
+class FixtureServer(socketserver.ThreadingMixIn, HTTPServer):
+    """FixtureServer class
+
+    HTTP server answering like Yahoo Finance and the Twitter search API,
+    each response delayed by latency seconds. The number of requests of
+    each API is counted.
+    """
+    daemon_threads = True
+
+    def __init__(self, fixtures, latency=0.0, port=0):
+        HTTPServer.__init__(self, ('127.0.0.1', port), FixtureHandler)
+        self.fixtures = fixtures
+        self.latency = latency
+        self.counts = {'history': 0, 'download': 0, 'quote': 0, 'search': 0}
+        self.lock = threading.Lock()
+
+    @property
+    def url(self):
+        return 'http://127.0.0.1:{}'.format(self.server_address[1])
+
+    def count(self, name):
+        with self.lock:
+            self.counts[name] += 1
+
+    def start(self):
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+
+class FixtureHandler(BaseHTTPRequestHandler):
+
+    def reply(self, status, body, content_type='text/plain', headers=()):
+        data = body.encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(data)))
+        for name, value in headers:
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        server = self.server
+        time.sleep(server.latency)
+        url = urlparse(self.path)
+        query = {k: v[0] for k, v in parse_qs(url.query).items()}
+        parts = url.path.strip('/').split('/')
+
+        # /quote/<symbol>/history
+        if len(parts) == 3 and parts[0] == 'quote':
+            server.count('history')
+            self.reply(200, HISTORY_PAGE, 'text/html', [('Set-Cookie', 'B=fixture; Path=/')])
+        # /v7/finance/download/<symbol>?period1=&period2=&crumb=
+        elif parts[:3] == ['v7', 'finance', 'download'] and len(parts) == 4:
+            server.count('download')
+            if query.get('crumb') != CRUMB:
+                return self.reply(401, 'Invalid cookie')
+            csv = server.fixtures.history(parts[3], int(query['period1']), int(query['period2']))
+            if csv is None:
+                return self.reply(404, 'No data found')
+            self.reply(200, csv, 'text/csv')
+        # /v7/finance/quote?symbols=<symbol>
+        elif url.path == '/v7/finance/quote':
+            server.count('quote')
+            symbol = query.get('symbols', '')
+            result = [{'symbol': symbol, 'longName': symbol + ' Fixture'}] \
+                if symbol in server.fixtures.histories else []
+            self.reply(200, json.dumps({'quoteResponse': {'result': result}}), 'application/json')
+        # /1.1/search/tweets.json?q=&count=&until=&max_id=
+        elif url.path == '/1.1/search/tweets.json':
+            server.count('search')
+            statuses = server.fixtures.search(query.get('count', 15), query.get('until'), query.get('max_id'))
+            self.reply(200, json.dumps({'statuses': statuses}), 'application/json')
+        else:
+            self.reply(404, 'Not found')
+
+    def log_message(self, format, *args):
+        pass
+
+
+class FixtureStatus:
+    """Status of the search API, as used by Sentiment (its JSON)."""
+
+    def __init__(self, json):
+        self._json = json
+
+
+def fixture_share(url):
+    """Class replacing yahoo_finance.Share, whose name is asked to the
+    fixture server (None for an unknown symbol)."""
+    session = requests.Session()
+
+    class FixtureShare:
+
+        def __init__(self, symbol):
+            self.symbol = symbol
+
+        def get_name(self):
+            r = session.get(url + '/v7/finance/quote', params={'symbols': self.symbol})
+            r.raise_for_status()
+            result = r.json()['quoteResponse']['result']
+            return result[0]['longName'] if result else None
+    return FixtureShare
+
+
+def twitter_backend(url):
+    """Search function (like tweepy.API.search) querying the fixture server."""
+    session = requests.Session()
+
+    def search(**kwargs):
+        r = session.get(url + '/1.1/search/tweets.json', params=kwargs)
+        r.raise_for_status()
+        return [FixtureStatus(s) for s in r.json()['statuses']]
+    return search
@@ -0,0 +1,212 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Offline load test of the server and micro-benchmarks of the sentiment.
+
+The server runs against local stand-ins for Yahoo Finance and Twitter (see
+fixtures.py), with stores in a temporary directory, so nothing goes to the
+network and every run starts cold. Each route is called by concurrent
+clients:
+
+    /stocks/<index>, /stocks/<index>/<date_start>/<date_end>, /index/<index>,
+    /sentiment/<tweet>, /sentiment/<index>/<date_start>/<date_end>
+
+For each route the first call of each URL (cold, it goes upstream) is
+reported apart from the load, which reports p50/p95/p99 latency, throughput
+and errors. The RSS is the one of the process, clients included.
+
+Usage (from src/server):
+    python benchmarks/load_test.py [--requests N] [--concurrency C]
+        [--latency MS] [--fixtures DIR] [--json FILE]
+"""
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+import json
+import os
+import resource
+import sys
+import tempfile
+import threading
+import time
+from urllib.parse import quote
+
+import numpy as np
+import requests
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import config
+from fixtures import DATA_DIR, TWEETS_FILES, Fixtures, FixtureServer, fixture_share, twitter_backend
+
+SYMBOLS = ['AAPL', 'MSFT', 'GOOG', 'AMZN', 'TSLA', 'NFLX', 'INTC', 'ORCL']
+N_MICRO = 2000
+
+
+def rss():
+    """Current and peak resident memory of the process, in MB."""
+    current = None
+    if os.path.exists('/proc/self/status'):
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    current = int(line.split()[1]) / 1024
+    # ru_maxrss is in kilobytes on Linux
+    return current, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def isolate(directory):
+    """Point the stores of the server to a temporary directory, before the
+    server modules read the configuration."""
+    config.STOCKS_STORE_DIR = os.path.join(directory, 'stocks')
+    config.SENTIMENT_STORE_FILE = os.path.join(directory, 'sentiment.db')
+    config.SYMBOLS_FILE = os.path.join(directory, 'symbols.csv')
+    with open(config.SYMBOLS_FILE, 'w') as f:
+        f.write('Symbol,Name\n' + ''.join('{0},{0} Fixture\n'.format(s) for s in SYMBOLS))
+
+
+def start_server(upstream):
+    """Start the application on a local port, with its upstream calls going
+    to the fixture server. Returns the url of the application."""
+    from werkzeug.serving import WSGIRequestHandler, make_server
+    from opistocks import app
+    from opistocks.Sentiment import Sentiment
+    from opistocks.Stocks import Stocks
+
+    # The symbols missing from the index (NOPE) are checked on the fixtures
+    sys.modules['opistocks.Stocks'].Share = fixture_share(upstream)
+    Stocks.yahoo.HISTORY_URL = upstream + '/quote/{}/history'
+    Stocks.yahoo.DOWNLOAD_URL = upstream + '/v7/finance/download/{0}?period1={1}&period2={2}&interval=1d&events=history&crumb={3}'
+    Sentiment().twitter.backend = twitter_backend(upstream)
+
+    class QuietHandler(WSGIRequestHandler):
+        def log_request(self, *args):
+            pass
+
+    server = make_server('127.0.0.1', 0, app, threaded=True, request_handler=QuietHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return 'http://127.0.0.1:{}'.format(server.server_port)
+
+
+def tweets():
+    """Annotated tweets usable in an url."""
+    import pandas as pd
+    texts = []
+    for name in TWEETS_FILES:
+        texts.extend(pd.read_csv(os.path.join(DATA_DIR, name), encoding='latin1')['text'].astype(str))
+    return [t for t in texts if '/' not in t and t.strip()]
+
+
+def scenarios(texts):
+    """Paths of the requests of each route."""
+    today = datetime.today()
+    week = (today - timedelta(days=6)).strftime('%Y%m%d'), today.strftime('%Y%m%d')
+    year = (today - timedelta(days=365)).strftime('%Y%m%d'), today.strftime('%Y%m%d')
+    return [
+        ('/stocks/<index>', ['/stocks/' + s for s in SYMBOLS]),
+        ('/stocks/<index>/<start>/<end>', ['/stocks/{}/{}/{}'.format(s, *year) for s in SYMBOLS]),
+        ('/index/<index>', ['/index/' + s for s in SYMBOLS + ['NOPE']]),
+        ('/sentiment/<tweet>', ['/sentiment/' + quote(t, safe='') for t in texts[:500]]),
+        ('/sentiment/<index>/<start>/<end>', ['/sentiment/{}/{}/{}'.format(s, *week) for s in SYMBOLS[:2]]),
+    ]
+
+
+def load(url, paths, n_requests, concurrency):
+    """Call the paths (in turn) n_requests times from concurrent clients.
+    Returns the latencies (seconds), the number of errors and the wall time."""
+    local = threading.local()
+
+    def call(path):
+        if not hasattr(local, 'session'):
+            local.session = requests.Session()
+        start = time.perf_counter()
+        try:
+            ok = local.session.get(url + path).status_code < 400
+        except requests.RequestException:
+            ok = False
+        return time.perf_counter() - start, ok
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(call, [paths[i % len(paths)] for i in range(n_requests)]))
+    wall = time.perf_counter() - start
+    return np.array([r[0] for r in results]), sum(not r[1] for r in results), wall
+
+
+def load_test(url, upstream, n_requests, concurrency, texts):
+    report = []
+    for name, paths in scenarios(texts):
+        counts = dict(upstream.counts)
+        # Cold: the first call of each url, one at a time
+        cold, cold_errors, _ = load(url, paths, len(paths), 1)
+        latencies, errors, wall = load(url, paths, n_requests, concurrency)
+        p50, p95, p99 = np.percentile(latencies, [50, 95, 99]) * 1e3
+        result = {
+            'route': name, 'cold_ms': 1e3 * cold.mean(), 'requests': n_requests,
+            'p50_ms': p50, 'p95_ms': p95, 'p99_ms': p99,
+            'throughput': n_requests / wall, 'errors': errors + cold_errors,
+            'upstream_calls': {k: v - counts[k] for k, v in upstream.counts.items()},
+            'rss_mb': rss()[0],
+        }
+        report.append(result)
+        print('{route:<34} cold {cold_ms:8.1f} ms | p50 {p50_ms:7.1f} ms  p95 {p95_ms:7.1f} ms  '
+              'p99 {p99_ms:7.1f} ms | {throughput:7.1f} req/s | {errors} errors | '
+              'upstream {upstream_calls}'.format(**result))
+    return report
+
+
+def micro_benchmarks(texts):
+    """Time per tweet of Sentiment.sentiment (cold and cached) and of a batch."""
+    from opistocks.Sentiment import Sentiment
+    s = Sentiment()
+    sample = texts[:N_MICRO]
+    result = {}
+
+    s.cache.clear()
+    start = time.perf_counter()
+    for t in sample:
+        s.sentiment(t)
+    result['sentiment_cold_us'] = 1e6 * (time.perf_counter() - start) / len(sample)
+
+    start = time.perf_counter()
+    for t in sample:
+        s.sentiment(t)
+    result['sentiment_cached_us'] = 1e6 * (time.perf_counter() - start) / len(sample)
+
+    s.cache.clear()
+    start = time.perf_counter()
+    s.sentiments(sample)
+    result['sentiments_batch_us'] = 1e6 * (time.perf_counter() - start) / len(sample)
+
+    print('Sentiment.sentiment: {sentiment_cold_us:.1f} us/tweet cold, {sentiment_cached_us:.1f} us/tweet '
+          'cached, batch {sentiments_batch_us:.1f} us/tweet'.format(**result))
+    return result
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Offline load test of the server')
+    parser.add_argument('--requests', type=int, default=200, help='requests per route')
+    parser.add_argument('--concurrency', type=int, default=8, help='concurrent clients')
+    parser.add_argument('--latency', type=float, default=50, help='latency of the upstream APIs (ms)')
+    parser.add_argument('--fixtures', help='directory of recorded fixtures (see fixtures.py)')
+    parser.add_argument('--json', help='file to write the results to')
+    args = parser.parse_args()
+
+    isolate(tempfile.mkdtemp())
+    upstream = FixtureServer(Fixtures(SYMBOLS, args.fixtures), args.latency / 1000).start()
+    start = time.perf_counter()
+    url = start_server(upstream.url)
+    print('Server started in {:.1f} s, upstream latency {:.0f} ms, {} clients'.format(
+        time.perf_counter() - start, args.latency, args.concurrency))
+
+    texts = tweets()
+    results = {'load': load_test(url, upstream, args.requests, args.concurrency, texts),
+               'micro': micro_benchmarks(texts)}
+    current, peak = rss()
+    results['rss_mb'], results['peak_rss_mb'] = current, peak
+    print('RSS {} MB, peak {:.0f} MB'.format('?' if current is None else '{:.0f}'.format(current), peak))
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
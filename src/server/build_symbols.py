@@ -0,0 +1,50 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Build the index of the known ticker symbols (SYMBOLS_FILE) from the symbol
+directory of NASDAQ Trader, which lists the securities of the NASDAQ and of
+the other US exchanges (NYSE, NYSE American, NYSE Arca, BATS...).
+
+The symbols are written in the format of Yahoo Finance (BRK-B instead of
+BRK.B), the test issues are left out. Run it again to update the index.
+
+Usage: python build_symbols.py [symbols_file]
+"""
+import csv
+import io
+import sys
+
+import requests
+
+from config import SYMBOLS_FILE
+
+DIRECTORY_URL = 'https://www.nasdaqtrader.com/dynamic/SymDir/{}.txt'
+# File of the directory -> column of the symbol
+DIRECTORY_FILES = [('nasdaqlisted', 'Symbol'), ('otherlisted', 'ACT Symbol')]
+
+
+def read_directory(name, column):
+    """(symbol, name) pairs of a file of the directory."""
+    r = requests.get(DIRECTORY_URL.format(name), timeout=30)
+    r.raise_for_status()
+    # The last line is the creation time of the file
+    lines = [line for line in r.text.splitlines() if line and not line.startswith('File Creation Time')]
+    for row in csv.DictReader(io.StringIO('\n'.join(lines)), delimiter='|'):
+        if row.get('Test Issue') == 'Y':
+            continue
+        yield row[column].strip().replace('.', '-'), row['Security Name'].strip()
+
+
+if __name__ == '__main__':
+    path = sys.argv[1] if len(sys.argv) > 1 else SYMBOLS_FILE
+    names = {}
+    for name, column in DIRECTORY_FILES:
+        for symbol, security in read_directory(name, column):
+            names.setdefault(symbol, security)
+
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow(['Symbol', 'Name'])
+        writer.writerows(sorted(names.items()))
+    print('{} symbols written to {}'.format(len(names), path))
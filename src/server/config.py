@@ -19,3 +19,101 @@ THREADS_PER_PAGE = 4
 # Enable protection agains *Cross-site Request Forgery (CSRF)*
 CSRF_ENABLED = True
 
+# Directory of the local price history store (one file per index)
+STOCKS_STORE_DIR = os.path.join(BASE_DIR, 'data', 'stocks')
+
+# Number of seconds before the price of the current day is downloaded again
+STOCKS_TODAY_TTL = 15 * 60
+
+# Known ticker symbols (CSV file with the columns Symbol and Name, optional,
+# generated by build_symbols.py) and number of seconds the upstream checks of
+# the other symbols are kept (valid, unknown, and failed checks)
+SYMBOLS_FILE = os.path.join(BASE_DIR, 'symbols.csv')
+SYMBOLS_CACHE_SIZE = 10000
+SYMBOLS_VALID_TTL = 24 * 60 * 60
+SYMBOLS_INVALID_TTL = 60 * 60
+SYMBOLS_ERROR_TTL = 60
+
+# Number of threads downloading the histories of /stocks/batch and maximum
+# number of indexes of one batch
+STOCKS_BATCH_WORKERS = 8
+STOCKS_BATCH_MAX = 100
+
+# Number of rows of a price history encoded at once in a streamed response
+ENCODING_CHUNK_ROWS = 4096
+
+# Maximum number of indexes kept in memory and their time to live (seconds)
+STOCKS_CACHE_SIZE = 64
+STOCKS_CACHE_TTL = 60 * 60
+
+# Yahoo Finance session: seconds before the crumb is scraped again,
+# size of the connection pool and timeout of the requests (seconds)
+YAHOO_CRUMB_TTL = 60 * 60
+YAHOO_POOL_SIZE = 8
+YAHOO_TIMEOUT = 10
+
+# Twitter search: number of concurrent searches and rate limit of the
+# search API (requests per window of seconds)
+TWITTER_WORKERS = 8
+TWITTER_RATE_LIMIT = 180
+TWITTER_RATE_WINDOW = 15 * 60
+
+# Production model: pickle of (classifier, vectorizer) and the directory of
+# its memory mapped export (see export_model.py), used when it exists
+PICKLE_FILE = os.path.join(BASE_DIR, 'opistocks_classifier_vectorizer_prod.pickle')
+MODEL_DIR = os.path.join(BASE_DIR, 'opistocks_model')
+
+# Coefficients of the model smaller than this are ignored by the inference engine
+MODEL_PRUNE = 1e-3
+
+# Number of tweets whose sentiment is kept in memory
+SENTIMENT_CACHE_SIZE = 100000
+
+# Daily sentiment aggregates of the finished days (SQLite)
+SENTIMENT_STORE_FILE = os.path.join(BASE_DIR, 'data', 'sentiment.db')
+
+# Number of seconds the tags found for an index and a period are kept
+SENTIMENT_TAGS_TTL = 60 * 60
+
+# Maximum number of tweets classified for one day
+SENTIMENT_DAY_BUDGET = 300
+# The search of a day stops early when the 95% confidence interval of its mean
+# sentiment is narrower than +/- SENTIMENT_TOLERANCE, after at least
+# SENTIMENT_MIN_TWEETS tweets (None to always use the whole budget)
+SENTIMENT_TOLERANCE = 0.25
+SENTIMENT_MIN_TWEETS = 30
+
+# Number of seconds the sentiment of the current day is kept in memory
+SENTIMENT_TODAY_TTL = 15 * 60
+
+# Number of tags whose document frequency is kept to weight the trending tags
+TAGS_DF_CAPACITY = 100000
+
+# Default window (trading days) of the rolling correlation and largest lag
+# (trading days) of the cross correlation of /correlation
+CORRELATION_WINDOW = 5
+CORRELATION_MAX_LAG = 5
+
+# Maximum number of indexes of /correlation, each one runs the searches of
+# its sentiment on Twitter
+CORRELATION_MAX = 10
+
+# Number of threads fetching the prices and the sentiment of /dashboard concurrently
+DASHBOARD_WORKERS = 8
+
+# Background prefetch of the prices and of the sentiment of the watched
+# indexes: the indexes always watched, the requested ones are watched for
+# PREFETCH_WATCH_TTL seconds (at most PREFETCH_MAX_WATCHED of them)
+PREFETCH_ENABLED = True
+PREFETCH_INDEXES = []
+PREFETCH_WATCH_TTL = 24 * 60 * 60
+PREFETCH_MAX_WATCHED = 100
+# Seconds between two refreshes of an index, randomized by +/- PREFETCH_JITTER
+PREFETCH_INTERVAL = 15 * 60
+PREFETCH_JITTER = 0.2
+# Number of days of sentiment refreshed
+PREFETCH_DAYS = 7
+# Downloads from Yahoo per minute, and Twitter requests of the rate limit
+# window left to the users
+PREFETCH_YAHOO_RATE = 30
+PREFETCH_TWITTER_RESERVE = 60
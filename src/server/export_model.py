@@ -0,0 +1,21 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Export the production model (pickle of the classifier and of its TF-IDF
+or hashing vectorizer) to the memory mapped format loaded by the server.
+
+Usage: python export_model.py [pickle_file] [model_dir]
+"""
+import pickle
+import sys
+
+from config import MODEL_DIR, PICKLE_FILE
+from opistocks.Model import export_model
+
+if __name__ == '__main__':
+    pickle_file = sys.argv[1] if len(sys.argv) > 1 else PICKLE_FILE
+    model_dir = sys.argv[2] if len(sys.argv) > 2 else MODEL_DIR
+    classifier, vectorizer = pickle.load(open(pickle_file, 'rb'))
+    export_model(classifier, vectorizer, model_dir)
+    print('Model exported to {}'.format(model_dir))
@@ -0,0 +1,140 @@
+# -*- coding: utf-8 -*-
+
+from collections import OrderedDict
+import threading
+import time
+
+
+class Cache:
+    """Cache class
+
+    Thread-safe LRU cache whose entries expire after a time to live.
+
+    Values are created on demand with get(key, factory). Concurrent calls
+    for the same missing key wait for one single call of the factory
+    (single-flight) and get its value, or its exception if it fails, while
+    other keys are not blocked.
+
+    The number of hits and misses is counted.
+    """
+
+    def __init__(self, maxsize=128, ttl=None):
+        """Init of class
+
+        maxsize is the maximum number of entries, ttl the number of seconds
+        before an entry expires (None to never expire).
+        """
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        # Key -> call of the factory in progress
+        self._flights = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _lookup(self, key):
+        """Return (True, value) if the key is cached and not expired.
+        Must be called with the cache lock held.
+        """
+        entry = self._entries.get(key)
+        if entry is None:
+            return False, None
+        expires, value = entry
+        if expires is not None and expires < time.time():
+            del self._entries[key]
+            return False, None
+        self._entries.move_to_end(key)
+        return True, value
+
+    def lookup(self, key):
+        """Return (True, value) if the key is cached, else (False, None)."""
+        with self._lock:
+            found, value = self._lookup(key)
+            if found:
+                self.hits += 1
+            else:
+                self.misses += 1
+            return found, value
+
+    def get(self, key, factory):
+        """Get the value of key, create it with factory() if needed."""
+        with self._lock:
+            found, value = self._lookup(key)
+            if found:
+                self.hits += 1
+                return value
+            self.misses += 1
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+
+        if not leader:
+            # Wait for the call of the factory of another thread
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.value
+
+        try:
+            flight.value = factory()
+            self.set(key, flight.value)
+            return flight.value
+        except BaseException as e:
+            flight.error = e
+            raise
+        finally:
+            # The value is cached before the flight is removed, so no other
+            # call of the factory can start in between
+            with self._lock:
+                del self._flights[key]
+            flight.done.set()
+
+    def set(self, key, value, ttl=None):
+        """Store a value, evicting the least recently used entries.
+
+        ttl overrides the time to live of the cache for this entry.
+        """
+        ttl = self.ttl if ttl is None else ttl
+        expires = time.time() + ttl if ttl is not None else None
+        with self._lock:
+            self._entries[key] = (expires, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def pop(self, key, default=None):
+        """Remove a key from the cache and return its value."""
+        with self._lock:
+            entry = self._entries.pop(key, None)
+        return default if entry is None else entry[1]
+
+    def clear(self):
+        """Remove every entry."""
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        """Size of the cache and number of hits and misses."""
+        with self._lock:
+            return {'size': len(self._entries), 'hits': self.hits, 'misses': self.misses}
+
+    def __contains__(self, key):
+        with self._lock:
+            return self._lookup(key)[0]
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+
+class _Flight:
+    """Call of a factory in progress, and its outcome for the threads
+    waiting for it."""
+    __slots__ = ('done', 'value', 'error')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.error = None
@@ -0,0 +1,163 @@
+# -*- coding: utf-8 -*-
+
+"""
+Correlation of stock prices with the sentiment on Twitter, with numpy.
+
+The series of every ticker are put on one grid of trading days (the dates
+where at least one of the tickers has a price), one row per ticker, and all
+the statistics are computed for every row at once. Missing values are NaN
+and are ignored pair by pair.
+
+The sentiment of a day where the market is closed (weekend, holiday) counts
+for the next trading day: the sentiment of a trading day is the mean of the
+daily sentiments since the previous one.
+"""
+import numpy as np
+
+
+def grid_of(price_dates):
+    """Sorted trading days of a list of price date arrays."""
+    if not price_dates:
+        return np.zeros(0, dtype=np.int32)
+    return np.unique(np.concatenate(price_dates)).astype(np.int32)
+
+
+def prices_on_grid(grid, dates, values):
+    """Prices of the trading days of grid, NaN where the ticker has none."""
+    result = np.full(len(grid), np.nan)
+    i = np.searchsorted(grid, dates)
+    result[i] = values
+    return result
+
+
+def sentiments_on_grid(grid, days, values):
+    """Mean sentiment of the days counting for each trading day of grid.
+
+    A day counts for the first trading day on or after it, the days after
+    the last trading day are ignored.
+    """
+    days = np.asarray(days, dtype=np.int64)
+    values = np.asarray(values, dtype=np.float64)
+    i = np.searchsorted(grid, days, side='left')
+    keep = i < len(grid)
+    sums = np.bincount(i[keep], weights=values[keep], minlength=len(grid))
+    counts = np.bincount(i[keep], minlength=len(grid))
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.where(counts > 0, sums / counts, np.nan)
+
+
+def returns(prices):
+    """Daily returns along the last axis (NaN for the first day)."""
+    result = np.full(prices.shape, np.nan)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        result[..., 1:] = prices[..., 1:] / prices[..., :-1] - 1
+    return result
+
+
+def _pearson_of_sums(n, sx, sy, sxx, syy, sxy, min_periods):
+    """Pearson correlation from the sums of pairs, NaN if not enough pairs
+    or if one of the series is constant."""
+    with np.errstate(invalid='ignore', divide='ignore'):
+        cov = sxy - sx * sy / n
+        var = (sxx - sx * sx / n) * (syy - sy * sy / n)
+        r = cov / np.sqrt(var)
+    return np.where((n >= max(min_periods, 2)) & (var > 0), np.clip(r, -1, 1), np.nan)
+
+
+def _pairs(x, y):
+    """x and y centered, with zeros where one of them is missing, and the
+    mask of the valid pairs."""
+    valid = ~(np.isnan(x) | np.isnan(y))
+    x = np.where(valid, x, 0)
+    y = np.where(valid, y, 0)
+    # Centering first keeps the sums small, which avoids cancellations
+    n = np.maximum(valid.sum(-1, keepdims=True), 1)
+    x = np.where(valid, x - x.sum(-1, keepdims=True) / n, 0)
+    y = np.where(valid, y - y.sum(-1, keepdims=True) / n, 0)
+    return x, y, valid.astype(np.float64)
+
+
+def pearson(x, y, min_periods=2):
+    """Pearson correlation of x and y along the last axis."""
+    x, y, valid = _pairs(np.asarray(x, dtype=np.float64), np.asarray(y, dtype=np.float64))
+    return _pearson_of_sums(valid.sum(-1), x.sum(-1), y.sum(-1), (x * x).sum(-1),
+                            (y * y).sum(-1), (x * y).sum(-1), min_periods)
+
+
+def rolling_pearson(x, y, window, min_periods=None):
+    """Pearson correlation of x and y over a rolling window along the last
+    axis, with cumulative sums. The value of a day is the correlation of the
+    window ending on it (NaN for the first window - 1 days)."""
+    x, y, valid = _pairs(np.asarray(x, dtype=np.float64), np.asarray(y, dtype=np.float64))
+    result = np.full(x.shape, np.nan)
+    if window < 1 or x.shape[-1] < window:
+        return result
+
+    def windowed(a):
+        c = np.cumsum(a, axis=-1)
+        c = np.concatenate([np.zeros(a.shape[:-1] + (1,)), c], axis=-1)
+        return c[..., window:] - c[..., :-window]
+
+    result[..., window - 1:] = _pearson_of_sums(
+        windowed(valid), windowed(x), windowed(y), windowed(x * x), windowed(y * y),
+        windowed(x * y), window if min_periods is None else min_periods)
+    return result
+
+
+def cross_correlation(x, y, max_lag, min_periods=2):
+    """Correlation of x[t] and y[t + lag] for every lag from -max_lag to
+    max_lag, along the last axis. Returns the lags and the correlations (one
+    column per lag)."""
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    n = x.shape[-1]
+    lags = np.arange(-max_lag, max_lag + 1)
+    result = np.full(x.shape[:-1] + (len(lags),), np.nan)
+    for j, lag in enumerate(lags):
+        if abs(lag) >= n:
+            continue
+        if lag >= 0:
+            result[..., j] = pearson(x[..., :n - lag], y[..., lag:], min_periods)
+        else:
+            result[..., j] = pearson(x[..., -lag:], y[..., :n + lag], min_periods)
+    return lags, result
+
+
+def correlate(prices, sentiments, window, max_lag):
+    """Correlation of the sentiment with the returns of the prices.
+
+    prices and sentiments have one row per ticker and one column per trading
+    day. Returns a dict of arrays with one row per ticker:
+
+        - returns: daily returns
+        - pearson: correlation over the whole period
+        - rolling: rolling correlation over window trading days
+        - lags, cross_correlation: correlation of the sentiment of a day with
+          the return lag trading days later (a positive lag means the
+          sentiment leads the price)
+        - best_lag: lag of the strongest cross correlation
+    """
+    r = returns(prices)
+    lags, cross = cross_correlation(sentiments, r, max_lag)
+    strongest = np.where(np.isnan(cross), -1, np.abs(cross))
+    best = np.where(np.isnan(cross).all(-1), np.nan, lags[np.argmax(strongest, axis=-1)])
+    return {
+        'returns': r,
+        'pearson': pearson(sentiments, r),
+        'rolling': rolling_pearson(sentiments, r, window),
+        'lags': lags,
+        'cross_correlation': cross,
+        'best_lag': best,
+    }
+
+
+def ranking(pearson):
+    """Order of the tickers, strongest correlation (positive or negative)
+    first and the ones without correlation last."""
+    return np.argsort(-np.where(np.isnan(pearson), -1, np.abs(pearson)), kind='mergesort')
+
+
+def to_list(a):
+    """List of the values of an array for JSON, NaN as None."""
+    a = np.asarray(a, dtype=np.float64)
+    return np.where(np.isnan(a), None, a).tolist()
@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+
+"""
+Encodings of a price history (dates and values arrays) in a response.
+
+    - application/json (default): list of [date, value] pairs
+    - application/vnd.opistocks.columns+json: {"dates": [...], "values": [...]}
+    - application/octet-stream: number of rows (uint32), then the dates
+      (int32) and the values (float64), all little endian
+
+The body is produced in chunks of rows, and compressed with gzip on the fly
+when the client accepts it. The ETag is a digest of the arrays and of the
+encoding, so an unchanged history is answered with 304 without encoding it.
+"""
+import hashlib
+import json
+import struct
+import zlib
+
+import numpy as np
+
+from config import ENCODING_CHUNK_ROWS
+
+JSON = 'application/json'
+COLUMNS = 'application/vnd.opistocks.columns+json'
+BINARY = 'application/octet-stream'
+FORMATS = [JSON, COLUMNS, BINARY]
+
+
+def choose_format(accept_mimetypes):
+    """Format of the response from the Accept header (JSON by default)."""
+    return accept_mimetypes.best_match(FORMATS, default=JSON)
+
+
+def etag(dates, values, mimetype, gzip=False):
+    """Digest of a history in an encoding."""
+    h = hashlib.sha1('{}\0{}\0'.format(mimetype, gzip).encode('ascii'))
+    h.update(np.ascontiguousarray(dates, dtype='<i4').tobytes())
+    h.update(np.ascontiguousarray(values, dtype='<f8').tobytes())
+    return h.hexdigest()
+
+
+def encode(dates, values, mimetype, chunk_rows=ENCODING_CHUNK_ROWS):
+    """Chunks of the encoded history."""
+    n = len(dates)
+    if mimetype == BINARY:
+        yield struct.pack('<I', n)
+        for i in range(0, n, chunk_rows):
+            yield np.ascontiguousarray(dates[i:i + chunk_rows], dtype='<i4').tobytes()
+        for i in range(0, n, chunk_rows):
+            yield np.ascontiguousarray(values[i:i + chunk_rows], dtype='<f8').tobytes()
+    elif mimetype == COLUMNS:
+        yield '{"dates": ['
+        for i in range(0, n, chunk_rows):
+            yield (', ' if i else '') + json.dumps(dates[i:i + chunk_rows].tolist())[1:-1]
+        yield '], "values": ['
+        for i in range(0, n, chunk_rows):
+            yield (', ' if i else '') + json.dumps(values[i:i + chunk_rows].tolist())[1:-1]
+        yield ']}'
+    else:
+        # Same text as json.dumps of the list of [date, value] pairs
+        yield '['
+        for i in range(0, n, chunk_rows):
+            rows = zip(dates[i:i + chunk_rows].tolist(), values[i:i + chunk_rows].tolist())
+            yield (', ' if i else '') + json.dumps(list(rows))[1:-1]
+        yield ']'
+
+
+def gzip_chunks(chunks):
+    """Compress chunks (bytes or text) in the gzip format, on the fly."""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        data = compressor.compress(chunk.encode('utf-8') if isinstance(chunk, str) else chunk)
+        if data:
+            yield data
+    yield compressor.flush()
@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+
+from functools import lru_cache
+
+import numpy as np
+
+from config import MODEL_PRUNE
+from .Model import prune_coefficients
+
+
+class InferenceEngine:
+    """InferenceEngine class
+
+    Fast prediction path for the exported production model (see Model.py).
+
+    The tweets are tokenized with the precompiled pattern of the vectorizer,
+    their terms looked up or hashed (with a cache of the most frequent ones),
+    weighted by IDF and L2 normalised, and the classes scored with a sparse
+    dot product against pruned float32 coefficients, the whole batch at once.
+    The pruned coefficients are written by export_model and mapped in memory
+    like the rest of the model, they are only built at load time for an
+    export without them.
+
+    Pruning and float32 change the scores very slightly. When the two best
+    classes of a tweet are too close for the error to be ruled out, the
+    tweet is scored again with the exact float64 classifier, so the labels
+    are always the ones of Sentiment.sentiment().
+    """
+
+    def __init__(self, classifier, vectorizer, prune=MODEL_PRUNE, cache_size=2 ** 16):
+        self.classifier = classifier
+        self.vectorizer = vectorizer
+        self.analyze = vectorizer.analyze
+        self.counts = vectorizer.counts
+        self.feature = lru_cache(maxsize=cache_size)(vectorizer.feature)
+        self.idf = np.asarray(vectorizer.idf, dtype=np.float64)
+        self.intercept = np.asarray(classifier.intercept, dtype=np.float64)
+        self.classes = [int(c) for c in classifier.classes]
+        self.l2 = vectorizer.norm == 'l2'
+        self.sublinear_tf = vectorizer.sublinear_tf
+
+        # Features with at least one significant weight (row 0 is a zero row
+        # for the pruned ones) and largest error on a coefficient, the error
+        # on a score is at most this times the L1 norm of the features of the
+        # tweet. Mapped from the export if it was pruned the same way.
+        pruned = getattr(classifier, 'pruned', None)
+        if pruned is not None and pruned[0] == prune:
+            _, self.rows, self.weights, self.max_error = pruned
+        else:
+            self.rows, self.weights, self.max_error = prune_coefficients(classifier.coef, prune)
+
+    def features(self, tweets):
+        """Term ids, tweet of each term and TF-IDF values of a batch."""
+        ids = []
+        docs = []
+        tf = []
+        for n, tweet in enumerate(tweets):
+            counts = self.counts(self.analyze(tweet), self.feature)
+            ids.extend(counts.keys())
+            tf.extend(counts.values())
+            docs.extend([n] * len(counts))
+        ids = np.array(ids, dtype=np.int64)
+        docs = np.array(docs, dtype=np.int64)
+        x = np.array(tf, dtype=np.float64)
+        if self.sublinear_tf:
+            x = np.sign(x) * (np.log(np.abs(x)) + 1)
+        x *= self.idf[ids]
+        if self.l2:
+            norms = np.sqrt(np.bincount(docs, weights=x * x, minlength=len(tweets)))
+            norms[norms == 0] = 1
+            x /= norms[docs]
+        return ids, docs, x
+
+    def decision_function(self, tweets):
+        """Approximate score of each class, one row per tweet."""
+        ids, docs, x = self.features(tweets)
+        contrib = self.weights[self.rows[ids]] * x[:, None]
+        scores = np.empty((len(tweets), len(self.classes)), dtype=np.float64)
+        for k in range(len(self.classes)):
+            scores[:, k] = np.bincount(docs, weights=contrib[:, k], minlength=len(tweets))
+        scores += self.intercept
+        return scores, ids, docs, x
+
+    def predict(self, tweets):
+        """Sentiment values (1, 3 or 5) of a batch of tweets."""
+        if len(tweets) == 0:
+            return []
+        scores, ids, docs, x = self.decision_function(tweets)
+        best = np.argmax(scores, axis=1)
+
+        if len(self.classes) > 1:
+            top = np.sort(scores, axis=1)
+            margin = top[:, -1] - top[:, -2]
+            bound = 2 * self.max_error * np.bincount(docs, weights=np.abs(x), minlength=len(tweets))
+            unsure = np.flatnonzero(margin <= bound + 1e-12)
+            if len(unsure):
+                # Exact scores for the close calls
+                X = self.vectorizer.transform([tweets[i] for i in unsure])
+                best[unsure] = np.argmax(self.classifier.decision_function(X), axis=1)
+
+        return [self.classes[i] for i in best]
@@ -0,0 +1,281 @@
+# -*- coding: utf-8 -*-
+
+import json
+import os
+import re
+import zlib
+
+import numpy as np
+import scipy.sparse as sp
+from sklearn.feature_extraction.text import TfidfTransformer
+from sklearn.utils import murmurhash3_32
+
+from config import MODEL_PRUNE
+
+# Files of an exported model, the vocabulary is not written in hashing mode
+META_FILE = 'meta.json'
+ARRAYS = ['coef', 'intercept', 'classes', 'idf']
+VOCABULARY_ARRAYS = ['terms', 'offsets', 'slots']
+# Pruned coefficients of the inference engine (optional)
+PRUNED_ARRAYS = ['rows', 'weights']
+
+
+def term_hash(term):
+    """Stable hash of a term, the same in every process."""
+    return zlib.crc32(term)
+
+
+def prune_coefficients(coef, prune=MODEL_PRUNE):
+    """Coefficients of the inference engine (see Inference.py).
+
+    Returns the row of the weights of each feature (rows, int32, 0 for the
+    features whose coefficients are all smaller than prune), the float32
+    weights of the kept features, one column per class (row 0 is zero), and
+    the largest error made on a coefficient.
+    """
+    coef = np.asarray(coef, dtype=np.float64).T
+    pruned = np.where(np.abs(coef) < prune, 0, coef)
+    kept = np.flatnonzero(np.abs(pruned).max(axis=1) > 0)
+    rows = np.zeros(len(coef), dtype=np.int32)
+    rows[kept] = np.arange(1, len(kept) + 1, dtype=np.int32)
+    weights = np.zeros((len(kept) + 1, coef.shape[1]), dtype=np.float32)
+    weights[1:] = pruned[kept]
+    error = np.abs(coef - weights[rows].astype(np.float64))
+    return rows, weights, float(error.max()) if error.size else 0.0
+
+
+def export_model(classifier, vectorizer, directory, prune=MODEL_PRUNE):
+    """Export a linear classifier (LinearSVC, SGDClassifier) and its
+    vectorizer to a directory.
+
+    The vectorizer is either a TfidfVectorizer or, in hashing mode, a
+    HashingVectorizer alone (no IDF weights, it normalizes itself) or a
+    pipeline of a HashingVectorizer and a TfidfTransformer.
+
+    Every array is written as a .npy file that load_model() maps in memory:
+    the coefficients, intercepts and classes of the classifier and the IDF
+    weights. The vocabulary of a TfidfVectorizer is stored as the UTF-8 terms
+    concatenated in the order of their feature ids, the offset of each term
+    and an open addressing hash table (slots) from term hash to feature id.
+    A hashing vectorizer has no vocabulary to store.
+
+    The coefficients of the inference engine, pruned with prune and in
+    float32, are written too, so that the processes do not each build a copy.
+    """
+    if hasattr(vectorizer, 'steps'):
+        words, tfidf = [step for _, step in vectorizer.steps]
+        if getattr(words, 'non_negative', False) or words.norm is not None:
+            raise ValueError('The HashingVectorizer must be signed and not normalized')
+        hashing = {'hashing': words.n_features,
+                   'alternate_sign': bool(getattr(words, 'alternate_sign', True))}
+    elif hasattr(vectorizer, 'n_features'):
+        words = vectorizer
+        if getattr(words, 'non_negative', False):
+            raise ValueError('The HashingVectorizer must be signed')
+        # Counts normalized by the vectorizer, without IDF
+        tfidf = TfidfTransformer(norm=words.norm, use_idf=False)
+        hashing = {'hashing': words.n_features,
+                   'alternate_sign': bool(getattr(words, 'alternate_sign', True))}
+    else:
+        words = vectorizer
+        tfidf = getattr(vectorizer, '_tfidf', vectorizer)
+        hashing = {}
+    if words.analyzer != 'word' or words.tokenizer or words.preprocessor or words.strip_accents:
+        raise ValueError('Only word analyzers with the default tokenizer can be exported')
+
+    stop_words = words.get_stop_words()
+    meta = {
+        'lowercase': bool(words.lowercase),
+        'token_pattern': words.token_pattern,
+        'ngram_range': list(words.ngram_range),
+        'stop_words': sorted(stop_words) if stop_words else [],
+        'norm': tfidf.norm,
+        'use_idf': bool(tfidf.use_idf),
+        'sublinear_tf': bool(tfidf.sublinear_tf),
+    }
+    meta.update(hashing)
+    n_features = classifier.coef_.shape[1]
+    arrays = {
+        'coef': np.asarray(classifier.coef_, dtype=np.float64),
+        'intercept': np.asarray(classifier.intercept_, dtype=np.float64),
+        'classes': np.asarray(classifier.classes_),
+        'idf': np.asarray(tfidf.idf_, dtype=np.float64) if tfidf.use_idf
+               else np.ones(n_features, dtype=np.float64),
+    }
+    if not hashing:
+        arrays.update(export_vocabulary(vectorizer.vocabulary_))
+    arrays['rows'], arrays['weights'], meta['max_error'] = prune_coefficients(arrays['coef'], prune)
+    meta['prune'] = prune
+
+    if not os.path.exists(directory):
+        os.makedirs(directory)
+    for name, array in arrays.items():
+        np.save(os.path.join(directory, name + '.npy'), array)
+    with open(os.path.join(directory, META_FILE), 'w') as f:
+        json.dump(meta, f, indent=2)
+
+
+def export_vocabulary(vocabulary):
+    """Arrays storing a vocabulary (dict from term to feature id)."""
+    vocabulary = sorted(vocabulary.items(), key=lambda x: x[1])
+    encoded = [term.encode('utf-8') for term, _ in vocabulary]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(t) for t in encoded])
+    terms = np.frombuffer(b''.join(encoded), dtype=np.uint8)
+
+    # Hash table at most half full, linear probing
+    size = 1
+    while size < 2 * len(encoded):
+        size *= 2
+    slots = np.full(size, -1, dtype=np.int32)
+    for i, term in enumerate(encoded):
+        h = term_hash(term) & (size - 1)
+        while slots[h] != -1:
+            h = (h + 1) & (size - 1)
+        slots[h] = i
+    return {'terms': terms, 'offsets': offsets, 'slots': slots}
+
+
+def load_model(directory):
+    """Load an exported model, mapped in memory.
+
+    Returns (classifier, vectorizer) like the production pickle. The arrays
+    are read only and backed by the page cache, so the processes of the
+    server share one copy of the model.
+    """
+    with open(os.path.join(directory, META_FILE)) as f:
+        meta = json.load(f)
+    names = ARRAYS if meta.get('hashing') else ARRAYS + VOCABULARY_ARRAYS
+    if 'prune' in meta:
+        names = names + PRUNED_ARRAYS
+    arrays = {name: np.load(os.path.join(directory, name + '.npy'), mmap_mode='r')
+              for name in names}
+    return MappedClassifier(meta, arrays), MappedVectorizer(meta, arrays)
+
+
+class MappedVectorizer:
+    """MappedVectorizer class
+
+    TF-IDF vectorizer reading its vocabulary and IDF weights from an exported
+    model. Produces the same features as the TfidfVectorizer it comes from.
+
+    In hashing mode, the feature of a term is the signed murmurhash of the
+    term modulo the number of features, like HashingVectorizer.
+    """
+
+    def __init__(self, meta, arrays):
+        self.lowercase = meta['lowercase']
+        self.pattern = re.compile(meta['token_pattern'])
+        self.ngram_range = tuple(meta['ngram_range'])
+        self.stop_words = frozenset(meta['stop_words'])
+        self.norm = meta['norm']
+        self.sublinear_tf = meta['sublinear_tf']
+        self.idf = arrays['idf']
+        self.n_features = meta.get('hashing')
+        self.alternate_sign = meta.get('alternate_sign', True)
+        if not self.n_features:
+            # Memory views on the mapped arrays, indexing them gives Python
+            # objects without going through numpy scalars
+            self.terms = memoryview(arrays['terms'])
+            self.offsets = memoryview(arrays['offsets'])
+            self.slots = memoryview(arrays['slots'])
+            self.mask = len(self.slots) - 1
+
+    def analyze(self, doc):
+        """Split a document into terms, like sklearn's word analyzer."""
+        if self.lowercase:
+            doc = doc.lower()
+        tokens = self.pattern.findall(doc)
+        if self.stop_words:
+            tokens = [t for t in tokens if t not in self.stop_words]
+        min_n, max_n = self.ngram_range
+        if max_n == 1:
+            return tokens
+        terms = tokens if min_n == 1 else []
+        for n in range(max(min_n, 2), max_n + 1):
+            terms.extend(' '.join(tokens[i:i + n]) for i in range(len(tokens) - n + 1))
+        return terms
+
+    def term_id(self, term):
+        """Feature id of a term, None if it is not in the vocabulary."""
+        term = term.encode('utf-8')
+        h = term_hash(term) & self.mask
+        while True:
+            i = self.slots[h]
+            if i == -1:
+                return None
+            if self.terms[self.offsets[i]:self.offsets[i + 1]] == term:
+                return i
+            h = (h + 1) & self.mask
+
+    def feature(self, term):
+        """Feature id and sign of a term, None if it is not in the vocabulary."""
+        if self.n_features:
+            h = murmurhash3_32(term, seed=0)
+            return abs(h) % self.n_features, 1 if h >= 0 or not self.alternate_sign else -1
+        i = self.term_id(term)
+        return None if i is None else (i, 1)
+
+    def counts(self, terms, feature=None):
+        """Signed number of occurrences of the features of terms."""
+        counts = {}
+        for f in map(feature or self.feature, terms):
+            if f is not None:
+                counts[f[0]] = counts.get(f[0], 0) + f[1]
+        if self.n_features:
+            # Colliding terms of opposite signs cancel out
+            counts = {i: c for i, c in counts.items() if c}
+        return counts
+
+    def transform(self, docs):
+        """TF-IDF matrix (sparse, one row per document)."""
+        indptr = [0]
+        indices = []
+        data = []
+        for doc in docs:
+            counts = self.counts(self.analyze(doc))
+            for i in sorted(counts):
+                indices.append(i)
+                data.append(counts[i])
+            indptr.append(len(indices))
+
+        data = np.array(data, dtype=np.float64)
+        indices = np.array(indices, dtype=np.int32)
+        if self.sublinear_tf:
+            data = np.sign(data) * (np.log(np.abs(data)) + 1)
+        data *= self.idf[indices]
+        X = sp.csr_matrix((data, indices, np.array(indptr)), shape=(len(docs), len(self.idf)))
+        if self.norm == 'l2':
+            norms = np.sqrt(np.asarray(X.multiply(X).sum(axis=1)).ravel())
+        elif self.norm == 'l1':
+            norms = np.asarray(abs(X).sum(axis=1)).ravel()
+        else:
+            return X
+        norms[norms == 0] = 1
+        X.data /= np.repeat(norms, np.diff(X.indptr))
+        return X
+
+
+class MappedClassifier:
+    """MappedClassifier class
+
+    Linear classifier (one-vs-rest) reading its coefficients from an exported
+    model. Predicts the same classes as the LinearSVC it comes from.
+
+    pruned is (prune, rows, weights, max_error) if the model has the
+    coefficients of the inference engine, else None.
+    """
+
+    def __init__(self, meta, arrays):
+        self.coef = arrays['coef']
+        self.intercept = arrays['intercept']
+        self.classes = arrays['classes']
+        self.pruned = None
+        if 'prune' in meta:
+            self.pruned = meta['prune'], arrays['rows'], arrays['weights'], meta['max_error']
+
+    def decision_function(self, X):
+        return X.dot(self.coef.T) + self.intercept
+
+    def predict(self, X):
+        return self.classes[np.argmax(self.decision_function(X), axis=1)]
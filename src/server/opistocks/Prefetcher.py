@@ -0,0 +1,125 @@
+# -*- coding: utf-8 -*-
+
+from datetime import datetime, timedelta
+import math
+import random
+import threading
+import time
+
+from config import (PREFETCH_DAYS, PREFETCH_INDEXES, PREFETCH_INTERVAL, PREFETCH_JITTER,
+                    PREFETCH_MAX_WATCHED, PREFETCH_TWITTER_RESERVE, PREFETCH_WATCH_TTL,
+                    PREFETCH_YAHOO_RATE, SENTIMENT_DAY_BUDGET)
+from .Sentiment import Sentiment
+from .Stocks import Stocks
+from .TwitterSearch import RateLimit
+
+
+class Prefetcher:
+    """Prefetcher class
+
+    Background thread refreshing the data of the watched indexes, so that the
+    requests find it in the stores instead of waiting for Yahoo and Twitter:
+
+        - the price history (only the missing days are downloaded)
+        - the sentiment of the last PREFETCH_DAYS days, the current one
+          included (kept in memory, see Sentiment)
+
+    The indexes of PREFETCH_INDEXES are always watched, the other ones for
+    PREFETCH_WATCH_TTL seconds after their last request that found values
+    (the unknown indexes are not watched). Each index is refreshed every
+    PREFETCH_INTERVAL seconds, with a random jitter so that the refreshes
+    do not all happen at once.
+
+    The refreshes are done one at a time. The downloads from Yahoo are
+    limited to PREFETCH_YAHOO_RATE per minute, and the sentiment is only
+    refreshed when PREFETCH_TWITTER_RESERVE requests to Twitter stay
+    available for the users in the current window.
+    """
+
+    def __init__(self, indexes=PREFETCH_INDEXES):
+        self.pinned = set(indexes)
+        # Index -> time of the last request, and time of the next refresh
+        self.watched = {}
+        self.due = {index: 0.0 for index in self.pinned}
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+        self.yahoo = RateLimit(PREFETCH_YAHOO_RATE, 60)
+        self.thread = None
+
+    def watch(self, index):
+        """Watch an index that has just been requested."""
+        with self.lock:
+            if index not in self.watched and len(self.watched) >= PREFETCH_MAX_WATCHED:
+                # Forget the index requested the longest time ago
+                oldest = min(self.watched, key=self.watched.get)
+                del self.watched[oldest]
+                if oldest not in self.pinned:
+                    del self.due[oldest]
+            self.watched[index] = time.time()
+            # The request itself just loaded the data
+            self.due.setdefault(index, self.next_time())
+
+    def next_time(self):
+        """Time of the next refresh of an index refreshed now."""
+        return time.time() + PREFETCH_INTERVAL * (1 + random.uniform(-PREFETCH_JITTER, PREFETCH_JITTER))
+
+    def pop_due(self):
+        """Index to refresh now (None if there is none) and the number of
+        seconds until the next one."""
+        with self.lock:
+            now = time.time()
+            for index in [i for i, t in self.watched.items() if now - t > PREFETCH_WATCH_TTL]:
+                del self.watched[index]
+                if index not in self.pinned:
+                    del self.due[index]
+            if not self.due:
+                return None, PREFETCH_INTERVAL
+            index = min(self.due, key=self.due.get)
+            if self.due[index] > now:
+                return None, self.due[index] - now
+            self.due[index] = self.next_time()
+            return index, 0
+
+    def refresh(self, index):
+        """Refresh the price history and the sentiment of an index."""
+        today = datetime.today()
+        stock = Stocks(index)
+        if not stock.is_index():
+            return
+        # A rate token only for an actual download
+        if stock.store.missing(19000101, int(today.strftime('%Y%m%d'))):
+            self.yahoo.acquire()
+        stock.get_arrays_between_dates('19000101', today.strftime('%Y%m%d'))
+
+        sentiment = Sentiment(index)
+        # Two searches for the tags, and the pages of each day (100 tweets
+        # each) until its budget is reached at most
+        searches = PREFETCH_DAYS * math.ceil(SENTIMENT_DAY_BUDGET / 100) + 2
+        if sentiment.twitter.rate_limit.available() >= PREFETCH_TWITTER_RESERVE + searches:
+            date_start = today - timedelta(days=PREFETCH_DAYS - 1)
+            sentiment.get_sentiments_twitter_between_dates(date_start.strftime('%Y%m%d'),
+                                                           today.strftime('%Y%m%d'), refresh=True)
+        else:
+            print('Prefetch of the sentiment of {} skipped, rate limit almost reached'.format(index))
+
+    def run(self):
+        """Loop of the thread: refresh the indexes when they are due."""
+        while not self.stopped.is_set():
+            index, wait = self.pop_due()
+            if index is None:
+                self.stopped.wait(min(wait, PREFETCH_INTERVAL))
+                continue
+            try:
+                print('Prefetch of {}'.format(index))
+                self.refresh(index)
+            except Exception as e:
+                print('Error while prefetching {} : {}'.format(index, e))
+
+    def start(self):
+        """Start the thread (daemon, it stops with the server)."""
+        if self.thread is None:
+            self.thread = threading.Thread(target=self.run, name='prefetcher', daemon=True)
+            self.thread.start()
+
+    def stop(self):
+        self.stopped.set()
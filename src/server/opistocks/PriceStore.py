@@ -0,0 +1,148 @@
+# -*- coding: utf-8 -*-
+
+from datetime import datetime, timedelta
+import numpy as np
+import os
+import tempfile
+import time
+
+from config import STOCKS_STORE_DIR, STOCKS_TODAY_TTL
+
+
+def shift_date(date, days):
+    """Add a number of days to a YYYYMMDD integer date."""
+    d = datetime.strptime(str(date), '%Y%m%d') + timedelta(days=days)
+    return int(d.strftime('%Y%m%d'))
+
+
+def today():
+    """Current day as a YYYYMMDD integer."""
+    return int(datetime.today().strftime('%Y%m%d'))
+
+
+class PriceStore:
+    """PriceStore class
+
+    Local price history of one index, persisted in a .npz file.
+
+    The history is kept as two sorted arrays, the dates (YYYYMMDD, int32) and
+    the adjusted closing prices (float64). The store also remembers which
+    range of dates has already been downloaded, so that only the missing days
+    (usually the newest ones) need to be requested from Yahoo.
+
+    The price of a day downloaded before the day is over is provisional: it
+    is downloaded again every STOCKS_TODAY_TTL seconds during the day, and
+    once more after the day, when it is final.
+    """
+    EMPTY = (0, 0)
+
+    def __init__(self, index, directory=STOCKS_STORE_DIR):
+        self.index = index
+        self.path = os.path.join(directory, '{}.npz'.format(index))
+        self.dates = np.empty(0, dtype=np.int32)
+        self.values = np.empty(0, dtype=np.float64)
+        # Range of dates already downloaded (both included)
+        self.covered = PriceStore.EMPTY
+        # First day downloaded before it was over (0 if none), and time of
+        # its last download
+        self.provisional = 0
+        self.updated = 0.0
+        self.load()
+
+    def load(self):
+        """Load the store from disk, if it exists."""
+        if not os.path.exists(self.path):
+            return
+        try:
+            with np.load(self.path) as f:
+                self.dates = f['dates'].astype(np.int32)
+                self.values = f['values'].astype(np.float64)
+                self.covered = tuple(int(x) for x in f['covered'])
+                self.updated = float(f['updated'])
+                # Stores without it may hold the provisional price of their last day
+                self.provisional = int(f['provisional']) if 'provisional' in f else self.covered[1]
+        except Exception as e:
+            print('Error while loading store of {} : {}'.format(self.index, e))
+
+    def save(self):
+        """Write the store to disk.
+
+        The file is written next to the destination, under a unique name, and
+        then renamed, so a crash never leaves a truncated store behind and
+        two stores of the same index saving at once do not mix their files.
+        """
+        directory = os.path.dirname(self.path)
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(suffix='.tmp.npz', dir=directory)
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                np.savez(f, dates=self.dates, values=self.values,
+                         covered=np.array(self.covered, dtype=np.int32),
+                         updated=np.float64(self.updated), provisional=np.int32(self.provisional))
+            os.replace(tmp, self.path)
+        except BaseException:
+            os.remove(tmp)
+            raise
+
+    def missing(self, date_start, date_end):
+        """Ranges of dates between date_start and date_end not in the store.
+
+        Returns a list of (start, end) tuples of YYYYMMDD integers. The ranges
+        are adjacent to the covered range so that it stays contiguous.
+        """
+        now = today()
+        date_end = min(date_end, now)
+        if date_start > date_end:
+            return []
+        if self.covered == PriceStore.EMPTY:
+            return [(date_start, date_end)]
+
+        c_start, c_end = self.covered
+        # A provisional price is downloaded again once its day is over, and
+        # once in a while during the day
+        if self.provisional and (self.provisional < now or time.time() - self.updated > STOCKS_TODAY_TTL):
+            c_end = min(c_end, shift_date(self.provisional, -1))
+
+        ranges = []
+        if date_start < c_start:
+            ranges.append((date_start, shift_date(c_start, -1)))
+        if date_end > c_end:
+            ranges.append((shift_date(c_end, 1), date_end))
+        return ranges
+
+    def update(self, dates, values, date_start, date_end):
+        """Merge downloaded values covering date_start to date_end.
+
+        Values already stored in this range are replaced.
+        """
+        dates = np.asarray(dates, dtype=np.int32)
+        values = np.asarray(values, dtype=np.float64)
+        keep = (self.dates < date_start) | (self.dates > date_end)
+        all_dates = np.concatenate((self.dates[keep], dates))
+        all_values = np.concatenate((self.values[keep], values))
+        order = np.argsort(all_dates, kind='mergesort')
+        self.dates = all_dates[order]
+        self.values = all_values[order]
+
+        now = today()
+        date_end = min(date_end, now)
+        if self.covered == PriceStore.EMPTY:
+            self.covered = (date_start, date_end)
+        else:
+            self.covered = (min(self.covered[0], date_start),
+                            max(self.covered[1], date_end))
+        if date_end >= now:
+            # The days before are over, the current one is not
+            self.provisional = now
+            self.updated = time.time()
+        elif date_start <= self.provisional <= date_end:
+            self.provisional = 0
+
+    def between(self, date_start, date_end):
+        """Dates and values between date_start and date_end (both included).
+
+        The bounds are found by binary search on the sorted dates.
+        """
+        i = np.searchsorted(self.dates, date_start, side='left')
+        j = np.searchsorted(self.dates, date_end, side='right')
+        return self.dates[i:j], self.values[i:j]
@@ -5,46 +5,87 @@ from sklearn.svm import LinearSVC
 import sklearn
 import pandas as pd
 import pickle
+import os
+import hashlib
+import threading
 
 from instance import config
 
 import tweepy
+from datetime import datetime, timedelta
 from dateutil.parser import parse
 from itertools import chain
-from nltk.tokenize import TweetTokenizer
-from nltk.corpus import stopwords
-import string
-from collections import Counter
-import numpy as np
+
+from config import (MODEL_DIR, PICKLE_FILE, SENTIMENT_CACHE_SIZE, SENTIMENT_DAY_BUDGET, SENTIMENT_MIN_TWEETS,
+                    SENTIMENT_TAGS_TTL, SENTIMENT_TODAY_TTL, SENTIMENT_TOLERANCE)
+from .Cache import Cache
+from .Inference import InferenceEngine
+from .Model import load_model
+from .SentimentStore import Aggregate, SentimentStore
+from .TagExtractor import TagExtractor
+from .TwitterSearch import TwitterSearch
+
+
+def text_key(tweet):
+    """Key of a tweet in the cache of sentiments.
+
+    Digest of the text with its whitespaces collapsed, which does not change
+    the tokens seen by the classifier.
+    """
+    return hashlib.sha1(' '.join(tweet.split()).encode('utf-8')).digest()
+
 
 class Sentiment:
     """Sentiment class
 
     Interface to a SVM (Linear kernel) and its Vectorizer to classifiy into
     3 classes (positive, neutral, negative) tweets.
+
+    The model is shared by every request, the index is kept by each Sentiment
+    object so concurrent requests on different indexes do not interfere.
     """
     instance = None
+    # Concurrent first requests must build a single instance, it holds the
+    # rate limit of the Twitter searches
+    lock = threading.Lock()
 
-    def __init__(self, index):
+    def __init__(self, index=None):
         if not Sentiment.instance:
-            Sentiment.instance = Sentiment.__Sentiment(index)
-        else:
-            Sentiment.instance.index = index
+            with Sentiment.lock:
+                if not Sentiment.instance:
+                    Sentiment.instance = Sentiment.__Sentiment()
+        self.index = index
 
     def __getattr__(self, name):
         return getattr(self.instance, name)
 
+    def get_sentiments_twitter(self):
+        return self.instance.get_sentiments_twitter(self.index)
+
+    def get_sentiments_twitter_between_dates(self, date_start, date_end, refresh=False):
+        return self.instance.get_sentiments_twitter_between_dates(self.index, date_start, date_end, refresh)
+
     class __Sentiment:
         """Singleton class"""
-        PICKLE_FILE = 'opistocks_classifier_vectorizer_prod.pickle'
 
-        def __init__(self, index):
+        def __init__(self):
             """Init of class
 
-            Load the classifier and the vectorizer
+            Load the classifier and the vectorizer, from the memory mapped
+            export of the model if it exists, else from the pickle.
             """
-            self.classifier, self.vectorizer = pickle.load(open(self.PICKLE_FILE, 'rb'))
-            self.index = index
+            if os.path.exists(MODEL_DIR):
+                self.classifier, self.vectorizer = load_model(MODEL_DIR)
+                self.engine = InferenceEngine(self.classifier, self.vectorizer)
+            else:
+                self.classifier, self.vectorizer = pickle.load(open(PICKLE_FILE, 'rb'))
+                self.engine = None
+            self.cache = Cache(maxsize=SENTIMENT_CACHE_SIZE)
+            self.tags = Cache(maxsize=256, ttl=SENTIMENT_TAGS_TTL)
+            # Aggregates of the current day, not finished so not stored
+            self.today = Cache(maxsize=256, ttl=SENTIMENT_TODAY_TTL)
+            self.tag_extractor = TagExtractor()
+            self.store = SentimentStore()
 
             # Authentify to Twitter API
             consumer_key = config.CONSUMER_KEY
@@ -54,77 +95,196 @@ class Sentiment:
 
             self.auth = tweepy.OAuthHandler(consumer_key, consumer_secret)
             self.auth.set_access_token(access_token, access_token_secret)
+            self.twitter = TwitterSearch(tweepy.API(self.auth).search)
 
         def sentiment(self, tweet):
-            vec = self.vectorizer.transform([tweet])
-            return int(str(self.classifier.predict(vec)[0]))
+            return self.sentiments([tweet])[0]
 
-        def get_sentiments_twitter(self):
-            date_end = datetime.today().strftime('%Y%m%d')
-            date_start = str(int(date_end) - 7)
-            return self.get_sentiments_twitter_between_dates(date_start, date_end)
+        def sentiments(self, tweets):
+            """Sentiment values of a batch of tweets
 
-        def get_sentiments_twitter_between_dates(self, date_start, date_end):
-            """Sentiment value from tweets over a period of time
+            The values of the tweets already seen come from the cache. The
+            other tweets are deduplicated and classified together, each
+            unique text once.
+            """
+            keys = [text_key(t) for t in tweets]
+            values = {}
+            todo = {}
+            for key, tweet in zip(keys, tweets):
+                if key in values or key in todo:
+                    continue
+                found, value = self.cache.lookup(key)
+                if found:
+                    values[key] = value
+                else:
+                    todo[key] = tweet
 
-            This method works in different steps.
-            1)  Search two times for tweets distributed over the period selected
-                for the wanted stock market index
-            2)  Determine the N most used tags in the previously downloaded tweets
-            3)  Search one time per day the tweets with the N most used tags
-            4)  Format the retrieved tweets to send them in response of the API call
+            if todo:
+                for key, value in zip(todo.keys(), self.classify(list(todo.values()))):
+                    values[key] = value
+                    self.cache.set(key, value)
+            return [values[key] for key in keys]
+
+        def classify(self, tweets):
+            """Classify a batch of tweets, without the cache
+
+            The whole batch is vectorized into one sparse matrix and
+            classified with a single call to the classifier.
+            """
+            if self.engine is not None:
+                return self.engine.predict(tweets)
+            if len(tweets) == 0:
+                return []
+            vec = self.vectorizer.transform(tweets)
+            return [int(x) for x in self.classifier.predict(vec)]
+
+        def get_sentiments_twitter(self, index):
+            date_end = datetime.today()
+            date_start = date_end - timedelta(days=7)
+            return self.get_sentiments_twitter_between_dates(index, date_start.strftime('%Y%m%d'),
+                                                             date_end.strftime('%Y%m%d'))
+
+        def get_tags(self, index, date_start, date_end):
+            """N most relevant tags in tweets about index
+
+            Search two times for tweets distributed over the period selected
+            (the searches are run concurrently) and extract their tags (see
+            TagExtractor).
             """
             N_TAGS = 5
-            SEND_TWEETS = False
 
             # Change format of dates
             d_start = parse(date_start).strftime('%Y-%m-%d')
             d_end = parse(date_end).strftime('%Y-%m-%d')
 
             # Search tweets
-            query = f'{self.index} -filter:retweets'
-            api = tweepy.API(self.auth)
-            results_search_end = api.search(q=query, lang='en', results_type='popular', count=100, until=d_end)
-            results_search_start = api.search(q=query, lang='en', results_type='popular', count=100, until=d_start)
-            results = [{'text': x._json['text'], 'created_at': x._json['created_at']} for x in list(chain(results_search_start, results_search_end))]
-
-            # N most used tags
-            tokenizer = TweetTokenizer()
-            l = list(chain.from_iterable([tokenizer.tokenize(tweet['text']) for tweet in results]))
-            stop = set(stopwords.words('english'))
-            l = [i.lower() for i in l if i.lower() not in stop]
-            l = [i for i in l if i not in string.punctuation]
-            tags = [i[0] for i in Counter(l).most_common(N_TAGS)]
+            query = f'{index} -filter:retweets'
+            results_search_start, results_search_end = self.twitter.search_many([
+                dict(q=query, lang='en', result_type='popular', count=100, until=d_start),
+                dict(q=query, lang='en', result_type='popular', count=100, until=d_end)])
+
+            # N most relevant tags
+            tags = self.tag_extractor.extract((x._json['text'] for x in chain(results_search_start, results_search_end)),
+                                              N_TAGS)
             print(tags)
+            return tags
 
-            # Retrieve sentiments for tweets
-            tweets = []
-            for i in range(int(date_end) - int(date_start) + 1):
-                cur_date = parse(str(int(date_start) + i)).strftime('%Y-%m-%d')
-                query = '{} OR {} -filter:retweets'.format(self.index, ' OR '.join(tags))
-                tweets.append(api.search(q=query, lang='eng', results_type='mixed', count=100, until=cur_date))
-
-            # Analyze tweets
-            tweets = [{'text': x._json['text'],
-                    'created_at': parse(x._json['created_at']).strftime('%Y%m%d'),
-                    'sentiment': self.sentiment(x._json['text'])} for x in list(chain.from_iterable(tweets))]
-
-            # Separate the tweets by date
-            tweets_date = {}
-            for t in tweets:
-                cur_date = int(t['created_at'])
-                if cur_date not in tweets_date.keys():
-                    tweets_date[cur_date] = [[], []]
-                tweets_date[cur_date][0].append(t['text'])
-                tweets_date[cur_date][1].append(t['sentiment'])
-
-            # Mean sentiment by date
-            data = []
-            for key, value in tweets_date.items():
-                mean_sentiment = np.mean(value[1])
-                if SEND_TWEETS:
-                    data.append([key, mean_sentiment, list(zip(value[0], value[1]))])
-                else:
-                    data.append([key, mean_sentiment])
+        def collect_days(self, query, days, budget=SENTIMENT_DAY_BUDGET, tolerance=SENTIMENT_TOLERANCE):
+            """Aggregates of the sentiment of the tweets of days
+
+            days is a list of (YYYYMMDD, datetime) pairs. The tweets of each
+            day are retrieved page by page (created before the next day,
+            newest first) until the day is over or budget tweets of the day
+            are classified. The days are searched concurrently.
+
+            The search of a day also stops as soon as its mean sentiment is
+            known well enough: when the confidence interval of the mean is
+            narrower than +/- tolerance (after SENTIMENT_MIN_TWEETS tweets),
+            and the mean of the last page is within tolerance of the mean of
+            the pages before it. The tweets come in chronological order, the
+            latest of the day first, so the second condition keeps the search
+            going while the sentiment drifts along the day. A clear-cut day
+            needs fewer requests than a divided one.
+
+            The tweets are classified and aggregated page by page, only their
+            ids are kept. A page of the search of a day may hold tweets of
+            another day of the list: they count for it, and a tweet found by
+            two searches counts once.
+            """
+            aggregates = {key: Aggregate.of([]) for key, _ in days}
+            taken = {key: 0 for key, _ in days}
+            seen = set()
+            lock = threading.Lock()
+
+            def converged(before, page):
+                """Whether the mean of a day is known well enough, from the
+                aggregates of the previous pages and of the last one."""
+                if tolerance is None or page.count == 0 or before.count == 0:
+                    return False
+                aggregate = before.merge(page)
+                if aggregate.count < SENTIMENT_MIN_TWEETS:
+                    return False
+                low, high = aggregate.interval()
+                return high - low <= 2 * tolerance and abs(page.mean - before.mean) <= tolerance
+
+            def collect(item):
+                key, day = item
+                for page in self.twitter.pages(q=query, lang='en', result_type='recent', count=100,
+                                               until=(day + timedelta(days=1)).strftime('%Y-%m-%d')):
+                    texts = {}
+                    oldest = key
+                    with lock:
+                        for status in page:
+                            tweet = status._json
+                            tweet_day = int(parse(tweet['created_at']).strftime('%Y%m%d'))
+                            oldest = min(oldest, tweet_day)
+                            if tweet['id'] in seen or tweet_day not in taken or taken[tweet_day] >= budget:
+                                continue
+                            seen.add(tweet['id'])
+                            taken[tweet_day] += 1
+                            texts.setdefault(tweet_day, []).append(tweet['text'])
+
+                    page = Aggregate.of([])
+                    with lock:
+                        before = aggregates[key]
+                    for tweet_day, day_texts in texts.items():
+                        aggregate = Aggregate.of(self.sentiments(day_texts))
+                        if tweet_day == key:
+                            page = aggregate
+                        with lock:
+                            aggregates[tweet_day] = aggregates[tweet_day].merge(aggregate)
+
+                    # The pages go back in time
+                    if oldest < key or taken[key] >= budget or converged(before, page):
+                        break
+
+            self.twitter.map(collect, days)
+            return aggregates
+
+        def get_sentiments_twitter_between_dates(self, index, date_start, date_end, refresh=False):
+            """Sentiment value from tweets over a period of time
+
+            This method works in different steps.
+            1)  Read the aggregates of the finished days from the store, and
+                the one of the current day from memory (computed less than
+                SENTIMENT_TODAY_TTL ago, unless refresh is set)
+            2)  If days are missing, determine the N most used tags for the
+                wanted stock market index (see get_tags, kept in memory for a while)
+            3)  Search the tweets of each missing day with the N most used
+                tags (see collect_days), classify them and store the
+                aggregates of finished days
+            4)  Format the mean sentiment of each day, and its 95% confidence
+                interval, to send them in response of the API call
+            """
+            first_day, last_day = parse(date_start), parse(date_end)
+            days = [first_day + timedelta(days=i) for i in range((last_day - first_day).days + 1)]
+            if not days:
+                return []
+            today = datetime.utcnow().strftime('%Y%m%d')
+            day_keys = [int(day.strftime('%Y%m%d')) for day in days]
+            aggregates = self.store.get(index, day_keys[0], day_keys[-1])
+            aggregates.pop(int(today), None)
+            if int(today) in day_keys and not refresh:
+                found, aggregate = self.today.lookup((index, int(today)))
+                if found:
+                    aggregates[int(today)] = aggregate
+
+            missing = [(key, day) for key, day in zip(day_keys, days)
+                       if key <= int(today) and key not in aggregates]
+            if missing:
+                tags = self.tags.get((index, date_start, date_end),
+                                     lambda: self.get_tags(index, date_start, date_end))
+
+                query = '{} OR {} -filter:retweets'.format(index, ' OR '.join(tags))
+                collected = self.collect_days(query, missing)
+                for key, _ in missing:
+                    aggregates[key] = collected[key]
+                    if key < int(today):
+                        self.store.put(index, key, aggregates[key])
+                    else:
+                        self.today.set((index, key), aggregates[key])
 
-            return data
+            # Mean sentiment by date and its confidence interval (None for a
+            # single tweet), in day order
+            return [[key, aggregates[key].mean] + list(aggregates[key].interval() or (None, None))
+                    for key in sorted(aggregates) if aggregates[key].count > 0]
@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+
+from collections import Counter, namedtuple
+import math
+import os
+import sqlite3
+import threading
+
+from config import SENTIMENT_STORE_FILE
+
+
+class Aggregate(namedtuple('Aggregate', ['count', 'sum', 'negative', 'neutral', 'positive'])):
+    """Sentiments of the tweets of one day: number of tweets, sum of their
+    sentiments and number of tweets of each class (1, 3 and 5)."""
+    __slots__ = ()
+
+    @classmethod
+    def of(cls, sentiments):
+        """Aggregate of a list of sentiments."""
+        hist = Counter(sentiments)
+        return cls(len(sentiments), sum(sentiments), hist[1], hist[3], hist[5])
+
+    def merge(self, other):
+        """Aggregate of the tweets of both aggregates."""
+        return Aggregate(*(a + b for a, b in zip(self, other)))
+
+    @property
+    def mean(self):
+        return self.sum / self.count if self.count else None
+
+    def interval(self, z=1.96):
+        """Confidence interval of the mean, 95% by default (normal
+        approximation), None with less than two tweets."""
+        if self.count < 2:
+            return None
+        squares = self.negative + 9 * self.neutral + 25 * self.positive
+        variance = max(squares - self.sum * self.sum / self.count, 0) / (self.count - 1)
+        half = z * math.sqrt(variance / self.count)
+        # The sentiments are between 1 and 5
+        return max(self.mean - half, 1), min(self.mean + half, 5)
+
+
+class SentimentStore:
+    """SentimentStore class
+
+    Daily sentiment aggregates of each index, persisted in SQLite.
+
+    The tweets of a finished day never change, so its aggregate is computed
+    once and then read from the store.
+    """
+
+    def __init__(self, path=SENTIMENT_STORE_FILE):
+        directory = os.path.dirname(path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        with self.lock, self.db:
+            self.db.execute('CREATE TABLE IF NOT EXISTS aggregates ('
+                            'idx TEXT, day INTEGER, count INTEGER, sum INTEGER, '
+                            'negative INTEGER, neutral INTEGER, positive INTEGER, '
+                            'PRIMARY KEY (idx, day))')
+
+    def get(self, index, date_start, date_end):
+        """Aggregates of index between dates (YYYYMMDD, both included).
+
+        Returns a dict from day to Aggregate, only for the stored days.
+        """
+        with self.lock:
+            rows = self.db.execute('SELECT day, count, sum, negative, neutral, positive '
+                                   'FROM aggregates WHERE idx = ? AND day BETWEEN ? AND ?',
+                                   (index, date_start, date_end)).fetchall()
+        return {row[0]: Aggregate(*row[1:]) for row in rows}
+
+    def put(self, index, day, aggregate):
+        """Store the aggregate of a day, replacing the previous one."""
+        with self.lock, self.db:
+            self.db.execute('INSERT OR REPLACE INTO aggregates VALUES (?, ?, ?, ?, ?, ?, ?)',
+                            (index, day) + tuple(aggregate))
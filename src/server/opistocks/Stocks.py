@@ -4,13 +4,34 @@ from datetime import datetime, timezone
 from flask import jsonify
 import json
 import pandas as pd
+import numpy as np
 from pandas_datareader import data, wb
 from yahoo_finance import Share
-import requests
-import os
-import yaml
-import re
 import io
+import re
+import threading
+
+from config import STOCKS_CACHE_SIZE, STOCKS_CACHE_TTL
+from .Cache import Cache
+from .PriceStore import PriceStore, shift_date
+from .SymbolIndex import SymbolIndex
+from .YahooSession import YahooSession
+
+# Characters of the ticker symbols of Yahoo (BRK-B, ^GSPC, EURUSD=X, RDS.A)
+SYMBOL_PATTERN = re.compile(r'^[A-Z0-9.^=-]+$')
+
+
+class InvalidSymbol(ValueError):
+    """A string that cannot be a ticker symbol."""
+
+
+def parse_history(csv):
+    """Dates (int32, YYYYMMDD) and adjusted closing prices (float64) of a
+    history downloaded from Yahoo (CSV text), without any loop in Python."""
+    df = pd.read_csv(io.StringIO(csv), usecols=['Date', 'Adj Close'])
+    dates = pd.to_datetime(df['Date'], format='%Y-%m-%d').dt
+    dates = dates.year * 10000 + dates.month * 100 + dates.day
+    return dates.values.astype(np.int32), df['Adj Close'].values.astype(np.float64)
 
 
 class Stocks:
@@ -19,129 +40,125 @@ class Stocks:
     Using the yahoo_finance API and pandas to :
 
         - retrieve historical data (pandas, because its faster)
-        - check if an index exists (yahoo_finance)
+        - check if an index exists (yahoo_finance, see SymbolIndex)
 
     WARNING: since the 18th May 2017, the API from Yahoo as been terminated.
     This method to retrieve financial data is a big hack and will probably not last.
     This trick is based on: https://github.com/sjev/trading-with-python/blob/master/scratch/get_yahoo_data.ipynb
+
+    One object per index is kept in a bounded LRU cache shared by all the
+    threads of the server, so requests on different indexes do not overwrite
+    each other's data.
+
+    The index is stripped and uppercased, so aapl and AAPL share the same
+    object and store, and InvalidSymbol is raised if it is not a ticker
+    symbol (before it is used as a file name).
     """
-    instance = None
-    # Url for yahoo, stock needs to be inserted between START_URL and END_URL
-    START_URL = 'https://uk.finance.yahoo.com/quote/'
-    END_URL = '/history'
+    instances = Cache(maxsize=STOCKS_CACHE_SIZE, ttl=STOCKS_CACHE_TTL)
+    # Session to Yahoo shared by every index
+    yahoo = YahooSession()
+    # Known symbols, loaded once
+    symbols = SymbolIndex()
 
     def __init__(self, index):
-        if not Stocks.instance:
-            Stocks.instance = Stocks.__Stocks(index)
-        else:
-            Stocks.instance.index = index
-            Stocks.instance.stock = Share(index)
-            Stocks.instance._data = None
+        index = index.strip().upper()
+        if not SYMBOL_PATTERN.match(index):
+            raise InvalidSymbol('invalid index {}'.format(index))
+        self.instance = Stocks.instances.get(index, lambda: Stocks.__Stocks(index))
 
     def __getattr__(self, name):
         return getattr(self.instance, name)
 
     class __Stocks:
-        """Singleton class"""
+        """Stocks of one index, shared through the cache"""
 
         def __init__(self, index):
             """Init of class
 
-            Load the index.
+            Load the index and its local price history.
             """
             self.index = index
-            self.stock = Share(index)
-            self._data = None
+            self.store = PriceStore(index)
+            # Serialize the downloads, concurrent requests wait for the first one
+            self.lock = threading.RLock()
 
         @property
         def data(self):
             """Getter of data.
-            If data are not loaded, load them.
+            Whole history of the index, only the missing days are downloaded.
+            """
+            return self.get_hist_between_dates('19000101', datetime.today().strftime('%Y%m%d'))
+
+        @property
+        def arrays(self):
+            """Getter of arrays.
+            Whole history of the index as arrays (see get_arrays_between_dates).
             """
-            if self._data is None:
-                print('Loading data of {}'.format(self.index))
-                self.get_hist_between_dates('19000101', datetime.today().strftime('%Y%m%d'))
-            return self._data
+            return self.get_arrays_between_dates('19000101', datetime.today().strftime('%Y%m%d'))
 
         def get_all_hist(self):
             """Get historical data of index."""
             return json.dumps(self.data)
 
         def get_hist_between_dates(self, date_start, date_end):
-            """Get historical data of index between dates."""
+            """Get historical data of index between dates, as a list of
+            [date, value] pairs (see get_arrays_between_dates)."""
+            arrays = self.get_arrays_between_dates(date_start, date_end)
+            if arrays is None:
+                return None
+            dates, values = arrays
+            return [list(a) for a in zip(dates.tolist(), values.tolist())]
+
+        def get_arrays_between_dates(self, date_start, date_end):
+            """Get historical data of index between dates.
+
+            Returns the dates (int32, YYYYMMDD) and the adjusted closing prices
+            (float64), or None if the index does not exist or the data cannot
+            be retrieved.
+
+            The values come from the local store, only the dates it does not
+            hold yet are downloaded and added to it. Concurrent calls share the
+            same download.
+            """
             try:
-                if self.is_index():
-                    # Creation of the url
-                    url = Stocks.START_URL + self.index + Stocks.END_URL
-                    print(url)
-                    # Download the page
-                    r = requests.get(url)
-                    txt = r.text
-                    cookie = r.cookies['B'] # the cooke we're looking for is named 'B'
-                    print('Cookie: ', cookie)
-
-                    # Now we need to extract the token from html.
-                    # the string we need looks like this: "CrumbStore":{"crumb":"lQHxbbYOBCq"}
-                    # regular expressions will do the trick!
-                    pattern = re.compile('.*"CrumbStore":\{"crumb":"(?P<crumb>[^"]+)"\}')
-
-                    for line in txt.splitlines():
-                        m = pattern.match(line)
-                        if m is not None:
-                            crumb = m.groupdict()['crumb']
-
-                    print('Crumb=',crumb)
-
-                    # Create data directory in the user folder
-                    dataDir = os.getcwd() + '/twpData'
-
-                    if not os.path.exists(dataDir):
-                        os.mkdir(dataDir)
-
-                    # Save data to YAML file
-                    data = {'cookie':cookie,'crumb':crumb}
-
-                    dataFile = os.path.join(dataDir,'yahoo_cookie.yml')
-
-                    with open(dataFile,'w') as fid:
-                        yaml.dump(data,fid)
-
-                    # Change format of dates
-                    d_start = datetime.strptime(date_start, '%Y%m%d').timestamp()
-                    d_end = datetime.strptime(date_end, '%Y%m%d').timestamp()
-
-                    # Prepare input data as a tuple
-                    data = (self.index,
-                            int(d_start),
-                            int(d_end),
-                            crumb)
-
-                    url = "https://query1.finance.yahoo.com/v7/finance/download/{0}?period1={1}&period2={2}&interval=1d&events=history&crumb={3}".format(*data)
-
-                    print(url)
-                    # Retrieve the data
-                    data = requests.get(url, cookies={'B':cookie})
-
-                    buf = io.StringIO(data.text) # Create a buffer
-                    df = pd.read_csv(buf,index_col=0)['Adj Close'] # Convert to pandas DataFrame
-
-                    # Convert the date format from timestamp to YYYYMMDD
-                    dates = [int(pd.to_datetime(x).strftime("%Y%m%d")) for x in df.index.values.tolist()]
-                    self._data = [list(a) for a in zip(dates,
-                                  df.values.tolist())]
-                    return self._data
+                date_start, date_end = int(date_start), int(date_end)
+                with self.lock:
+                    missing = self.store.missing(date_start, date_end)
+                    if missing:
+                        if not self.is_index():
+                            return None
+                        for d_start, d_end in missing:
+                            print('Loading data of {} from {} to {}'.format(self.index, d_start, d_end))
+                            dates, values = self.download(d_start, d_end)
+                            self.store.update(dates, values, d_start, d_end)
+                        self.store.save()
+
+                    return self.store.between(date_start, date_end)
             except Exception as e:
                 print('Error while getting historic of data : {}'.format(e))
                 return None
 
+        def download(self, date_start, date_end):
+            """Download historical data of index between dates (both included).
+
+            Returns the dates (YYYYMMDD) and the adjusted closing prices.
+            """
+            # Change format of dates, the end date is included
+            d_start = datetime.strptime(str(date_start), '%Y%m%d').timestamp()
+            d_end = datetime.strptime(str(shift_date(date_end, 1)), '%Y%m%d').timestamp()
+
+            # Retrieve the data
+            return parse_history(Stocks.yahoo.download(self.index, int(d_start), int(d_end)))
+
         def is_index(self):
-            """Check if an index exists."""
-            try:
-                return bool(self.stock.get_name())
-            except:
-                return False
+            """Check if an index exists.
+
+            In memory with the index of symbols, yahoo_finance is only called
+            for the unknown symbols not checked recently.
+            """
+            return Stocks.symbols.is_index(self.index, lambda index: Share(index).get_name())
 
         def get_name(self):
             """Get the name of the index."""
-            return self.stock.get_name()
+            return Stocks.symbols.name(self.index) if self.is_index() else None
 
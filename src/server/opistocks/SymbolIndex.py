@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+
+from bisect import bisect_left
+import csv
+import os
+
+from config import SYMBOLS_CACHE_SIZE, SYMBOLS_ERROR_TTL, SYMBOLS_FILE, SYMBOLS_INVALID_TTL, SYMBOLS_VALID_TTL
+from .Cache import Cache
+
+
+class SymbolIndex:
+    """SymbolIndex class
+
+    Index of the known ticker symbols, kept in memory to check whether a
+    symbol exists and to complete the beginning of a symbol.
+
+    The symbols are loaded at startup from a CSV file (Symbol, Name) if it
+    exists, see build_symbols.py. A symbol that is not in it is checked
+    upstream, and the answer kept in a cache of valid symbols (with their
+    name) or in a cache of unknown symbols, both with a time to live. A
+    check that fails (network error) counts as unknown for the shorter
+    SYMBOLS_ERROR_TTL, so the requests do not each wait for upstream.
+    """
+
+    def __init__(self, path=SYMBOLS_FILE):
+        """Init of class
+
+        Load the symbols of the file path, if it exists.
+        """
+        self.names = {}
+        self.symbols = []
+        self.valid = Cache(maxsize=SYMBOLS_CACHE_SIZE, ttl=SYMBOLS_VALID_TTL)
+        self.invalid = Cache(maxsize=SYMBOLS_CACHE_SIZE, ttl=SYMBOLS_INVALID_TTL)
+        if os.path.exists(path):
+            with open(path, newline='', encoding='utf-8') as f:
+                for row in csv.DictReader(f):
+                    self.names[row['Symbol'].strip().upper()] = row.get('Name', '').strip()
+            self.symbols = sorted(self.names)
+            print('{} symbols loaded'.format(len(self.symbols)))
+
+    def name(self, symbol):
+        """Name of a symbol of the index or of the valid symbols cached,
+        None if it is not known."""
+        symbol = symbol.upper()
+        if symbol in self.names:
+            return self.names[symbol]
+        return self.valid.lookup(symbol)[1]
+
+    def complete(self, prefix, limit=10):
+        """Symbols of the index beginning with prefix, in alphabetical order,
+        as (symbol, name) pairs."""
+        prefix = prefix.upper()
+        i = bisect_left(self.symbols, prefix)
+        matches = []
+        for symbol in self.symbols[i:i + limit]:
+            if not symbol.startswith(prefix):
+                break
+            matches.append((symbol, self.names[symbol]))
+        return matches
+
+    def is_index(self, symbol, lookup):
+        """Check if a symbol exists.
+
+        lookup(symbol) asks upstream for the name of the symbol (empty if
+        it does not exist), it is only called for the symbols that are
+        neither in the index nor in the caches. If it raises, the symbol is
+        considered unknown for SYMBOLS_ERROR_TTL seconds.
+        """
+        key = symbol.upper()
+        if key in self.names:
+            return True
+        if self.valid.lookup(key)[0]:
+            return True
+        if self.invalid.lookup(key)[0]:
+            return False
+
+        try:
+            name = lookup(symbol)
+        except Exception as e:
+            print('Error while checking the symbol {} : {}'.format(symbol, e))
+            self.invalid.set(key, None, ttl=SYMBOLS_ERROR_TTL)
+            return False
+        if name:
+            self.valid.set(key, name)
+            return True
+        self.invalid.set(key, None)
+        return False
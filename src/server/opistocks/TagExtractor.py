@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+
+import heapq
+import math
+import string
+import threading
+from collections import Counter
+
+from nltk.corpus import stopwords
+from nltk.tokenize import TweetTokenizer
+
+from config import TAGS_DF_CAPACITY
+
+
+class TagExtractor:
+    """TagExtractor class
+
+    Find the most relevant tags of a set of tweets.
+
+    The tokenizer and the stop words are loaded once. The tokens of each tweet
+    go through a single filter pass (lowercase, no stop words, no
+    punctuation, no links) and each tag is counted once per tweet, so a tweet repeating
+    a word does not make it win.
+
+    The counts are weighted by the inverse document frequency of the tags in
+    all the tweets seen before (by previous extractions), so the boilerplate
+    tokens of every search do not win either. The table of the document
+    frequencies is bounded: when it is full, the rarest half is forgotten.
+    The top K tags are selected with a heap.
+
+    The table is shared by all the indexes on purpose: the tokens to push
+    down are the ones of the market in general (stock, price, today, buy...),
+    which only stand out across many indexes. A table per index would learn
+    that the name and the products of the company are frequent, and push
+    down the best tags instead. The tags of an index therefore depend on the
+    indexes searched before; Sentiment keeps them for a period for
+    SENTIMENT_TAGS_TTL, so the days of that period are searched with the
+    same tags.
+    """
+    # Tokens of the tweets themselves, not of what they talk about
+    BOILERPLATE = {'rt', 'via'}
+
+    def __init__(self, capacity=TAGS_DF_CAPACITY):
+        """Init of class
+
+        Load the tokenizer and the stop words, capacity is the maximum number
+        of tags whose document frequency is kept.
+        """
+        self.tokenizer = TweetTokenizer(preserve_case=False)
+        self.ignored = set(stopwords.words('english')) | self.BOILERPLATE
+        self.punctuation = set(string.punctuation)
+        self.capacity = capacity
+        self.df = Counter()
+        self.n_docs = 0
+        self.lock = threading.Lock()
+
+    def tags(self, text):
+        """Distinct tags of a tweet"""
+        return {token for token in self.tokenizer.tokenize(text)
+                if token not in self.ignored and not set(token) <= self.punctuation
+                and not token.startswith('http')}
+
+    def extract(self, texts, k=5):
+        """k most relevant tags of texts, the most relevant first"""
+        counts = Counter()
+        n_texts = 0
+        for text in texts:
+            counts.update(self.tags(text))
+            n_texts += 1
+
+        with self.lock:
+            # Smoothed IDF, the tags never seen before have the largest weight
+            n_docs = self.n_docs
+            weights = {tag: math.log((1 + n_docs) / (1 + self.df[tag])) + 1 for tag in counts}
+            self.df.update(counts)
+            self.n_docs += n_texts
+            if len(self.df) > self.capacity:
+                self.df = Counter(dict(self.df.most_common(self.capacity // 2)))
+
+        return [tag for tag, _ in heapq.nlargest(k, counts.items(),
+                                                key=lambda x: (x[1] * weights[x[0]], x[0]))]
@@ -0,0 +1,107 @@
+# -*- coding: utf-8 -*-
+
+from concurrent.futures import ThreadPoolExecutor
+import threading
+import time
+
+import tweepy
+
+from config import TWITTER_WORKERS, TWITTER_RATE_LIMIT, TWITTER_RATE_WINDOW
+
+
+class RateLimit:
+    """RateLimit class
+
+    Budget of requests allowed by an API in a window of time. When the budget
+    is spent, acquire() waits for the next window instead of failing.
+    """
+
+    def __init__(self, limit=TWITTER_RATE_LIMIT, window=TWITTER_RATE_WINDOW):
+        self.limit = limit
+        self.window = window
+        self.remaining = limit
+        self.reset = time.time() + window
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        """Take one request from the budget, wait if there is none left."""
+        while True:
+            with self.lock:
+                now = time.time()
+                if now >= self.reset:
+                    self.remaining = self.limit
+                    self.reset = now + self.window
+                if self.remaining > 0:
+                    self.remaining -= 1
+                    return
+                wait = self.reset - now
+            print('Rate limit reached, waiting {:.0f}s'.format(wait))
+            time.sleep(wait)
+
+    def available(self):
+        """Number of requests left in the current window."""
+        with self.lock:
+            if time.time() >= self.reset:
+                return self.limit
+            return self.remaining
+
+    def exhaust(self):
+        """The API told us the budget is spent before we counted it."""
+        with self.lock:
+            self.remaining = 0
+
+
+class TwitterSearch:
+    """TwitterSearch class
+
+    Run searches on the Twitter API concurrently through a bounded pool of
+    workers, within the rate limit of the search API.
+
+    The backend is the function doing one search (tweepy.API.search), it can
+    be replaced by any function taking the same keyword arguments.
+    """
+    RETRIES = 3
+
+    def __init__(self, backend, workers=TWITTER_WORKERS, rate_limit=None):
+        self.backend = backend
+        self.rate_limit = rate_limit if rate_limit is not None else RateLimit()
+        self.executor = ThreadPoolExecutor(max_workers=workers)
+
+    def search(self, **kwargs):
+        """One search, retried after a back off if the rate limit is hit."""
+        for attempt in range(TwitterSearch.RETRIES):
+            self.rate_limit.acquire()
+            try:
+                return self.backend(**kwargs)
+            except tweepy.RateLimitError:
+                if attempt == TwitterSearch.RETRIES - 1:
+                    raise
+                self.rate_limit.exhaust()
+
+    def search_many(self, queries):
+        """Run the searches concurrently.
+
+        queries is a list of dicts of keyword arguments for search(), the
+        results are returned in the same order.
+        """
+        futures = [self.executor.submit(self.search, **q) for q in queries]
+        return [f.result() for f in futures]
+
+    def pages(self, **kwargs):
+        """Pages of results of a search, newest tweets first.
+
+        Generator following the max_id cursor: the next page is requested
+        when the previous one has been consumed, until there are no more
+        results. Stop iterating to stop requesting.
+        """
+        while True:
+            page = self.search(**kwargs)
+            if not page:
+                return
+            yield page
+            kwargs['max_id'] = min(status._json['id'] for status in page) - 1
+
+    def map(self, function, items):
+        """Call function on every item concurrently, in the pool of workers
+        (function may call search() but not search_many())."""
+        return list(self.executor.map(function, items))
@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+
+import re
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from config import YAHOO_CRUMB_TTL, YAHOO_POOL_SIZE, YAHOO_TIMEOUT
+
+
+class YahooSession:
+    """YahooSession class
+
+    Long-lived HTTP session to Yahoo Finance, with a pool of connections kept
+    alive between requests.
+
+    The history CSV can only be downloaded with the cookie 'B' and the crumb
+    found in the HTML page of the history of a quote. Both are kept in memory
+    until they expire, the page is scraped again only when they are missing,
+    expired or rejected by Yahoo.
+    """
+    # Url for yahoo, stock needs to be inserted
+    HISTORY_URL = 'https://uk.finance.yahoo.com/quote/{}/history'
+    DOWNLOAD_URL = 'https://query1.finance.yahoo.com/v7/finance/download/{0}?period1={1}&period2={2}&interval=1d&events=history&crumb={3}'
+    # the string we need looks like this: "CrumbStore":{"crumb":"lQHxbbYOBCq"}
+    CRUMB_PATTERN = re.compile(r'"CrumbStore":\{"crumb":"(?P<crumb>[^"]+)"\}')
+
+    def __init__(self, ttl=YAHOO_CRUMB_TTL, pool_size=YAHOO_POOL_SIZE, timeout=YAHOO_TIMEOUT):
+        self.ttl = ttl
+        self.timeout = timeout
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self.crumb = None
+        self.expires = 0
+        self.lock = threading.Lock()
+
+    def refresh(self, index):
+        """Scrape the cookie and the crumb from the history page of index."""
+        r = self.session.get(self.HISTORY_URL.format(index), timeout=self.timeout)
+        r.raise_for_status()
+        m = self.CRUMB_PATTERN.search(r.text)
+        if m is None or 'B' not in self.session.cookies:
+            raise ValueError('No crumb found for {}'.format(index))
+        # The cookie stays in the session, only the crumb has to be kept
+        self.crumb = m.group('crumb')
+        self.expires = time.time() + self.ttl
+        print('Crumb=', self.crumb)
+
+    def get_crumb(self, index):
+        """Current crumb, scraped again if missing or expired."""
+        with self.lock:
+            if self.crumb is None or self.expires < time.time():
+                self.refresh(index)
+            return self.crumb
+
+    def invalidate(self, crumb):
+        """Forget the crumb if it is still the one rejected by Yahoo."""
+        with self.lock:
+            if self.crumb == crumb:
+                self.crumb = None
+
+    def download(self, index, period1, period2):
+        """Download the history of index as CSV text.
+
+        period1 and period2 are timestamps. If the download is rejected the
+        crumb is scraped again and the download retried once.
+        """
+        for attempt in range(2):
+            crumb = self.get_crumb(index)
+            url = self.DOWNLOAD_URL.format(index, period1, period2, crumb)
+            print(url)
+            r = self.session.get(url, timeout=self.timeout)
+            if r.status_code in (401, 403) and attempt == 0:
+                print('Crumb rejected, refreshing it')
+                self.invalidate(crumb)
+                continue
+            r.raise_for_status()
+            return r.text
@@ -1,12 +1,57 @@
 # -*- coding: utf-8 -*-
 
 from opistocks import app
-from .Stocks import Stocks
+from . import Correlation, Encoding
+from .Prefetcher import Prefetcher
+from .Stocks import InvalidSymbol, Stocks
 from .Sentiment import Sentiment
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 import json
 import numpy as np
 
-from flask import jsonify, Response
+from config import (CORRELATION_MAX, CORRELATION_MAX_LAG, CORRELATION_WINDOW, DASHBOARD_WORKERS,
+                    STOCKS_BATCH_MAX, STOCKS_BATCH_WORKERS)
+
+from flask import jsonify, Response, request, abort
+
+# Threads running the upstream calls of a request concurrently
+pool = ThreadPoolExecutor(max_workers=DASHBOARD_WORKERS)
+# Threads downloading the histories of the batches, apart so that a large
+# batch does not delay the other requests
+batch_pool = ThreadPoolExecutor(max_workers=STOCKS_BATCH_WORKERS)
+# Refresh of the requested indexes in background, started by run.py
+prefetcher = Prefetcher()
+
+
+@app.errorhandler(InvalidSymbol)
+def invalid_symbol(e):
+    """An index that cannot be a ticker symbol is a bad request."""
+    return jsonify(error=str(e)), 400
+
+
+def price_response(arrays):
+    """Streamed response of a price history (dates and values arrays).
+
+    The encoding is chosen by the Accept header and compressed if the client
+    accepts gzip (see Encoding.py). The response has an ETag and a request
+    with the same one in If-None-Match gets 304.
+    """
+    if arrays is None:
+        return Response(json.dumps(None), mimetype='application/json')
+    dates, values = arrays
+    mimetype = Encoding.choose_format(request.accept_mimetypes)
+    gzip = request.accept_encodings['gzip'] > 0
+    tag = Encoding.etag(dates, values, mimetype, gzip)
+    headers = {'ETag': '"{}"'.format(tag), 'Vary': 'Accept, Accept-Encoding'}
+    if request.if_none_match.contains(tag):
+        return Response(status=304, headers=headers)
+
+    body = Encoding.encode(dates, values, mimetype)
+    if gzip:
+        body = Encoding.gzip_chunks(body)
+        headers['Content-Encoding'] = 'gzip'
+    return Response(body, mimetype=mimetype, headers=headers)
 
 
 @app.route('/stocks/<index>')
@@ -17,6 +62,10 @@ def get_stocks(index):
     @apiGroup stocks
     @apiDescription Get all historic values for stocks.
     The value is the adjusted closing price of the day.
+    The response is streamed. With the header Accept: application/vnd.opistocks.columns+json
+    the values are sent as {"dates": [...], "values": [...]}, with Accept: application/octet-stream
+    as binary (number of rows as uint32, the dates as int32 and the values as float64, little endian).
+    It is compressed with Accept-Encoding: gzip and has an ETag (304 with If-None-Match).
 
     @apiParam {index} index     Intex to request the historic from
 
@@ -34,8 +83,10 @@ def get_stocks(index):
             "value": "19.04"
         }
     """
-    stock = Stocks(index)
-    return Response(json.dumps(stock.data), mimetype='application/json')
+    arrays = Stocks(index).arrays
+    if arrays is not None:
+        prefetcher.watch(index)
+    return price_response(arrays)
 
 
 @app.route('/stocks/<index>/<date_start>/<date_end>')
@@ -46,6 +97,10 @@ def get_stocks_between_date(index, date_start, date_end):
     @apiGroup stocks
     @apiDescription Get all historic values for stocks.
     The value is the adjusted closing price of the day.
+    The response is streamed. With the header Accept: application/vnd.opistocks.columns+json
+    the values are sent as {"dates": [...], "values": [...]}, with Accept: application/octet-stream
+    as binary (number of rows as uint32, the dates as int32 and the values as float64, little endian).
+    It is compressed with Accept-Encoding: gzip and has an ETag (304 with If-None-Match).
 
     @apiParam {index} index         Index to request the historic from
     @apiParam {String} date_start   Start date for the historic
@@ -62,8 +117,68 @@ def get_stocks_between_date(index, date_start, date_end):
             "value": "19.04"
         }
     """
-    stock = Stocks(index)
-    return Response(json.dumps(stock.get_hist_between_dates(date_start, date_end)), mimetype='application/json')
+    arrays = Stocks(index).get_arrays_between_dates(date_start, date_end)
+    if arrays is not None:
+        prefetcher.watch(index)
+    return price_response(arrays)
+
+
+def get_history(index, date_start, date_end):
+    """Values of index between dates as [date, value] pairs, or the error."""
+    try:
+        arrays = Stocks(index).get_arrays_between_dates(date_start, date_end)
+    except Exception as e:
+        print('Error while getting historic of {} : {}'.format(index, e))
+        return {'index': index, 'error': str(e)}
+    if arrays is None:
+        return {'index': index, 'error': 'no values'}
+    return {'index': index, 'values': [list(a) for a in zip(arrays[0].tolist(), arrays[1].tolist())]}
+
+
+@app.route('/stocks/batch', methods=['POST'])
+def get_stocks_batch():
+    """
+    @api {post} /stocks/batch Request stocks values of many indexes between two dates
+    @apiName get_stocks_batch
+    @apiGroup stocks
+    @apiDescription Get the historic values of a list of indexes in one call.
+    The missing values are downloaded concurrently (a bounded number at a time).
+    An index whose values cannot be retrieved gets an error instead of values,
+    the other ones are still returned.
+
+    @apiParam {String[]} indexes    Indexes to request the historic from (at most 100)
+    @apiParam {String} date_start   Start date for the historic
+    @apiParam {String} date_end     End date for the historic
+
+    @apiSuccess {Object[]} stocks   For each index, in the same order: index and values
+                                    ([date, value] pairs) or error
+
+    @apiSuccessExample Success-Response:
+        HTTP/1.1 200 OK
+        {
+            "stocks": [
+                {"index": "AAPL", "values": [[20160112, 15.04], [20160113, 19.04]]},
+                {"index": "XXXX", "error": "no values"}
+            ]
+        }
+    """
+    body = request.get_json(silent=True)
+    if not isinstance(body, dict):
+        abort(400)
+    indexes = body.get('indexes')
+    date_start, date_end = body.get('date_start'), body.get('date_end')
+    if not isinstance(indexes, list) or not all(isinstance(i, str) for i in indexes) \
+            or len(indexes) > STOCKS_BATCH_MAX or not isinstance(date_start, str) \
+            or not isinstance(date_end, str):
+        abort(400)
+
+    # Each index once, even if it is asked many times
+    futures = {index: batch_pool.submit(get_history, index, date_start, date_end) for index in set(indexes)}
+    stocks = [futures[index].result() for index in indexes]
+    for history in stocks:
+        if 'values' in history:
+            prefetcher.watch(history['index'])
+    return jsonify(stocks=stocks)
 
 
 # Route to check if an index exists
@@ -85,13 +200,38 @@ def check_index(index):
             "valid": true,
         }
     """
-    stock = Stocks(index)
+    try:
+        stock = Stocks(index)
+    except InvalidSymbol:
+        return jsonify(valid=False)
     if stock.is_index():
         return jsonify(valid=True)
     else:
         return jsonify(valid=False)
 
 
+# Route to complete the beginning of an index
+@app.route('/symbols/<prefix>')
+def complete_index(prefix):
+    """
+    @api {get} /symbols/:prefix Complete an index
+    @apiName complete_index
+    @apiGroup index
+    @apiDescription Known indexes beginning with a prefix, in alphabetical order (at most 10).
+
+    @apiParam {String} prefix Beginning of the index
+
+    @apiSuccess {Object[]} symbols  Symbol and name of each index
+
+    @apiSuccessExample Success-Response:
+        HTTP/1.1 200 OK
+        {
+            "symbols": [{"symbol": "AAPL", "name": "Apple Inc."}]
+        }
+    """
+    return jsonify(symbols=[{'symbol': symbol, 'name': name} for symbol, name in Stocks.symbols.complete(prefix)])
+
+
 # Route to predict the sentiment value of a tweet
 @app.route('/sentiment/<tweet>')
 def sentiment(tweet):
@@ -115,6 +255,34 @@ def sentiment(tweet):
     sent = s.sentiment(tweet)
     return jsonify(sentiment=np.asscalar(np.int16(sent)))
 
+@app.route('/sentiment/batch', methods=['POST'])
+def sentiment_batch():
+    """
+    @api {post} /sentiment/batch Predict sentiment of a batch of tweets
+    @apiName sentiment_batch
+    @apiGroup sentiment
+    @apiDescription Predict the sentiment of many tweets at once with a classifier (SVM).
+    The whole batch is classified in one call, which is much faster than
+    calling /sentiment/:tweet once per tweet.
+
+    @apiParam {String[]} tweets Tweets to classify
+
+    @apiSuccess {Integer[]} sentiments  Sentiment of each tweet, in the same order (1 negative, 3 neutral, 5 positive)
+
+    @apiSuccessExample Success-Response:
+        HTTP/1.1 200 OK
+        {
+            "sentiments": [5, 1, 3]
+        }
+    """
+    body = request.get_json(silent=True)
+    tweets = body.get('tweets') if isinstance(body, dict) else None
+    if not isinstance(tweets, list) or not all(isinstance(t, str) for t in tweets):
+        abort(400)
+    s = Sentiment()
+    return jsonify(sentiments=s.sentiments(tweets))
+
+
 @app.route('/sentiment/<index>/<date_start>/<date_end>')
 def get_sentiment_between_date(index, date_start, date_end):
     """
@@ -126,6 +294,163 @@ def get_sentiment_between_date(index, date_start, date_end):
     @apiParam {index} index         Index to request the historic from
     @apiParam {String} date_start   Start date for the historic
     @apiParam {String} date_end     End date for the historic
+
+    @apiSuccess {Array[]} sentiments    For each day: date, mean sentiment and the bounds of its
+                                        95% confidence interval (null for a single tweet)
+
+    @apiSuccessExample Success-Response:
+        HTTP/1.1 200 OK
+        [
+            [20160112, 3.4, 3.1, 3.7],
+            [20160113, 2.9, 2.6, 3.2]
+        ]
     """
+    stock = Stocks(index)
     s = Sentiment(index)
-    return Response(json.dumps(s.get_sentiments_twitter_between_dates(date_start, date_end)), mimetype='application/json')
+    sentiments = s.get_sentiments_twitter_between_dates(date_start, date_end)
+    if stock.is_index():
+        prefetcher.watch(index)
+    return Response(json.dumps(sentiments), mimetype='application/json')
+
+
+def get_series(index, date_start, date_end):
+    """Price arrays and daily sentiments of index between dates for the
+    correlation, and the error (None if there is none)."""
+    try:
+        arrays = Stocks(index).get_arrays_between_dates(date_start, date_end)
+        if arrays is None or len(arrays[0]) == 0:
+            return None, 'no values'
+        return (arrays, Sentiment(index).get_sentiments_twitter_between_dates(date_start, date_end)), None
+    except Exception as e:
+        print('Error while getting series of {} : {}'.format(index, e))
+        return None, str(e)
+
+
+@app.route('/correlation/<indexes>/<date_start>/<date_end>')
+def get_correlation(indexes, date_start, date_end):
+    """
+    @api {get} /correlation/:indexes/:date_start/:date_end Correlation of prices and sentiment
+    @apiName get_correlation
+    @apiGroup correlation
+    @apiDescription Correlate the daily returns of one or many indexes with their sentiment
+    on Twitter between two days. The series are aligned on the trading days, the sentiment
+    of the days where the market is closed counts for the next trading day.
+    The indexes are ranked by strength of the correlation (positive or negative).
+    The values of the indexes are retrieved concurrently, the indexes whose values
+    cannot be retrieved are reported in errors.
+
+    @apiParam {String} indexes      Index or comma separated list of indexes (at most 10)
+    @apiParam {String} date_start   Start date of the period
+    @apiParam {String} date_end     End date of the period
+    @apiParam {Integer} [window=5]  Number of trading days of the rolling correlation
+    @apiParam {Integer} [max_lag=5] Largest lag (trading days) of the cross correlation
+
+    @apiSuccess {Integer[]} dates       Trading days
+    @apiSuccess {Integer[]} lags        Lags of the cross correlation, positive when the sentiment leads
+    @apiSuccess {Object[]} correlations Ranked indexes: index, pearson, best_lag,
+                                        cross_correlation (one per lag), and one value per
+                                        trading day for returns, sentiments and rolling (null if unknown)
+    @apiSuccess {Object} errors         Error of each index that failed
+
+    @apiSuccessExample Success-Response:
+        HTTP/1.1 200 OK
+        {
+            "dates": [20170103, 20170104],
+            "lags": [-1, 0, 1],
+            "correlations": [{"index": "AAPL", "pearson": 0.31, "best_lag": 1, ...}],
+            "errors": {"XXXX": "no values"}
+        }
+    """
+    window = request.args.get('window', CORRELATION_WINDOW, type=int)
+    max_lag = request.args.get('max_lag', CORRELATION_MAX_LAG, type=int)
+    # Each index once, in the order of the request
+    indexes = list(OrderedDict.fromkeys(i for i in indexes.split(',') if i))
+    if window < 2 or max_lag < 0 or len(indexes) > CORRELATION_MAX:
+        abort(400)
+
+    futures = OrderedDict((index, batch_pool.submit(get_series, index, date_start, date_end)) for index in indexes)
+    series = {}
+    errors = {}
+    for index, future in futures.items():
+        values, error = future.result()
+        if error is None:
+            series[index] = values
+        else:
+            errors[index] = error
+
+    tickers = list(series)
+    grid = Correlation.grid_of([series[t][0][0] for t in tickers])
+    prices = np.array([Correlation.prices_on_grid(grid, *series[t][0]) for t in tickers]).reshape(len(tickers), len(grid))
+    sentiments = np.array([Correlation.sentiments_on_grid(grid, [row[0] for row in series[t][1]], [row[1] for row in series[t][1]])
+                           for t in tickers]).reshape(len(tickers), len(grid))
+    result = Correlation.correlate(prices, sentiments, window, max_lag)
+
+    correlations = [{
+        'index': tickers[k],
+        'pearson': Correlation.to_list(result['pearson'][k]),
+        'best_lag': None if np.isnan(result['best_lag'][k]) else int(result['best_lag'][k]),
+        'cross_correlation': Correlation.to_list(result['cross_correlation'][k]),
+        'returns': Correlation.to_list(result['returns'][k]),
+        'sentiments': Correlation.to_list(sentiments[k]),
+        'rolling': Correlation.to_list(result['rolling'][k]),
+    } for k in Correlation.ranking(result['pearson'])]
+    return jsonify(dates=grid.tolist(), lags=result['lags'].tolist(), correlations=correlations, errors=errors)
+
+
+@app.route('/dashboard/<index>/<date_start>/<date_end>')
+def get_dashboard(index, date_start, date_end):
+    """
+    @api {get} /dashboard/:index/:date_start/:date_end Request stocks and sentiment values of <index> between <date_start> and <date_end>
+    @apiName get_dashboard
+    @apiGroup dashboard
+    @apiDescription Get the stocks values and the sentiment values in one call.
+    Both are retrieved concurrently, so the call takes as long as the slower of the two.
+    The values are aligned on the dates where at least one of them is known,
+    the missing ones are null. If one part fails, its values are null and the
+    error is reported in errors.
+
+    @apiParam {index} index         Index to request the values of
+    @apiParam {String} date_start   Start date of the period
+    @apiParam {String} date_end     End date of the period
+
+    @apiSuccess {Integer[]} dates       Dates (YYYYMMDD)
+    @apiSuccess {Number[]} stocks       Adjusted closing price of each date
+    @apiSuccess {Number[]} sentiments   Mean sentiment of each date
+    @apiSuccess {Object} errors         Error of each part that failed
+
+    @apiSuccessExample Success-Response:
+        HTTP/1.1 200 OK
+        {
+            "dates": [20160112, 20160113],
+            "stocks": [15.04, 19.04],
+            "sentiments": [3.4, null],
+            "errors": {}
+        }
+    """
+    # The objects are built in the pool too, loading them may be slow
+    stocks = pool.submit(lambda: Stocks(index).get_arrays_between_dates(date_start, date_end))
+    sentiments = pool.submit(lambda: Sentiment(index).get_sentiments_twitter_between_dates(date_start, date_end))
+
+    errors = {}
+    stock_values = {}
+    try:
+        arrays = stocks.result()
+    except Exception as e:
+        print('Error while getting stocks : {}'.format(e))
+        arrays = None
+        errors['stocks'] = str(e)
+    if arrays is None:
+        errors.setdefault('stocks', 'no values')
+    else:
+        stock_values = dict(zip(arrays[0].tolist(), arrays[1].tolist()))
+        prefetcher.watch(index)
+    sentiment_values = {}
+    try:
+        sentiment_values = {row[0]: row[1] for row in sentiments.result()}
+    except Exception as e:
+        print('Error while getting sentiments : {}'.format(e))
+        errors['sentiments'] = str(e)
+
+    dates = sorted(set(stock_values) | set(sentiment_values))
+    return jsonify(dates=dates, stocks=[stock_values.get(d) for d in dates],
+                   sentiments=[sentiment_values.get(d) for d in dates], errors=errors)
@@ -4,13 +4,20 @@
 """
 Run the server
 """
+import os
+
 from opistocks import app
-from config import PORT, DEBUG
+from opistocks.views import prefetcher
+from config import PORT, DEBUG, PREFETCH_ENABLED
 
 __author__ = "Axel Fahy & Rudolf Hohn & Antoine Magnin"
 __version__ = "1.0"
 __date__ = "21.04.2017"
 __status__ = "Development"
 
+# With the debugger, the server runs in a child process started by the reloader
+if PREFETCH_ENABLED and (not DEBUG or os.environ.get('WERKZEUG_RUN_MAIN') == 'true'):
+    prefetcher.start()
+
 app.run(host='0.0.0.0', port=PORT, debug=DEBUG, threaded=True)
 